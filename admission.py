@@ -0,0 +1,194 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict
+
+# Chat requests allowed to run model-bound work at the same time; by default
+# the same as the model call limit, so nothing queues out of sight behind it
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", os.getenv("MAX_CONCURRENT_MODEL_CALLS", "32")))
+# Requests allowed to wait for a free slot; beyond this they are turned away
+ADMISSION_QUEUE_DEPTH = int(os.getenv("ADMISSION_QUEUE_DEPTH", "256"))
+# Seconds a request may wait for a slot before it is turned away
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Messages per second each user may send on average (0 turns the limit off),
+# and how many may arrive at once
+USER_RATE_LIMIT = float(os.getenv("USER_RATE_LIMIT", "0.5"))
+USER_RATE_BURST = float(os.getenv("USER_RATE_BURST", "5"))
+# Users whose token buckets are remembered; the least recently seen are forgotten
+USER_RATE_MAX_USERS = int(os.getenv("USER_RATE_MAX_USERS", "100000"))
+
+
+class Overloaded(Exception):
+    """The server cannot take this request now; retry after `retry_after` seconds."""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded FIFO admission in front of the model.
+
+    At most `max_active` requests hold a slot. Up to `queue_depth` more wait
+    in arrival order, each for at most `queue_timeout` seconds. Anything
+    beyond that fails at once with Overloaded, whose retry_after is
+    estimated from the recent time a slot is held.
+    """
+
+    def __init__(self, max_active: int = ADMISSION_MAX_ACTIVE,
+                 queue_depth: int = ADMISSION_QUEUE_DEPTH,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.max_active = max_active
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        # Moving average of how long a slot is held, for Retry-After
+        self._hold_seconds = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def retry_after(self) -> int:
+        backlog = (len(self._waiters) + 1) / max(self.max_active, 1)
+        return max(1, math.ceil(backlog * self._hold_seconds))
+
+    def check(self):
+        """Raise Overloaded now if acquire() would turn the request away."""
+        if self.active >= self.max_active and len(self._waiters) >= self.queue_depth:
+            self.rejected += 1
+            raise Overloaded("Server is busy", self.retry_after())
+
+    async def acquire(self):
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_depth:
+            self.rejected += 1
+            raise Overloaded("Server is busy", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded("Timed out waiting for capacity", self.retry_after())
+        except BaseException:
+            # Cancelled after release() handed us the slot: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+        self.admitted += 1
+
+    def release(self):
+        # Hand the slot straight to the oldest live waiter
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * (time.monotonic() - start)
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class UserRateLimiter:
+    """In-memory token bucket per user_id."""
+
+    def __init__(self, rate: float = USER_RATE_LIMIT, burst: float = USER_RATE_BURST,
+                 max_users: int = USER_RATE_MAX_USERS, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.clock = clock
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self.limited = 0
+
+    def acquire(self, user_id: str) -> float:
+        """Take one token. Returns 0 when allowed, else seconds until a token is free."""
+        if self.rate <= 0:
+            return 0.0
+        now = self.clock()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = [self.burst, now]
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        self.limited += 1
+        return (1 - bucket[0]) / self.rate
+
+    def stats(self) -> dict:
+        return {"users": len(self._buckets), "limited": self.limited}
+
+
+class _UserLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class UserLocks:
+    """One FIFO lock per user_id, so a conversation's turns run in order.
+
+    asyncio.Lock wakes waiters in arrival order. A lock is dropped as soon
+    as nobody holds or waits for it, so idle users cost nothing.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, _UserLock] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, user_id: str):
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = _UserLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._locks[user_id]
@@ -0,0 +1,339 @@
+"""Offline load test of /chat, replaying the turns recorded in chat.log.
+
+Every user turn in chat.log is sent through the FastAPI app in-process
+(no sockets, no Gemini). The model is replaced by ReplayModel, which
+sleeps a configurable latency and answers with the reply recorded for
+that message, so the numbers measure this service and not the network.
+
+    python benchmarks/bench_replay.py
+    python benchmarks/bench_replay.py --concurrency 1 8 32 --copies 16 --latency-ms 800
+    python benchmarks/bench_replay.py --json results.json
+    python benchmarks/bench_replay.py --endpoint /chat/batch --batch-size 16
+
+Each user's turns are split into sessions of --session-turns turns and
+sent in order, so conversation history builds up as it did in
+production. --copies replays the log that many times under distinct
+user ids to create more parallel sessions. For every
+concurrency level the report shows throughput, p50/p95/p99 latency,
+prompt sizes seen by the model and resident memory growth. With
+/chat/batch, concurrency counts batches in flight and latency is per batch;
+with /ws/chat it counts open connections, one per session.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from collections import OrderedDict, defaultdict, deque
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+# Never reach for config.py or the network
+os.environ.setdefault("GEMINI_STUB", "1")
+# Replayed sessions send turns far faster than a person types
+os.environ.setdefault("USER_RATE_LIMIT", "0")
+# Logs are still formatted, just not shown, unless --verbose is given
+if "--verbose" not in sys.argv:
+    os.environ.setdefault("LOG_FILE", os.devnull)
+
+import httpx  # noqa: E402
+
+import gemini_client  # noqa: E402
+import main  # noqa: E402
+from context_builder import ContextBuilder  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+from session_store import MemorySessionStore  # noqa: E402
+from stub_model import StubResponse, StubStream, stub_reply  # noqa: E402
+from structured_output import ParseStats  # noqa: E402
+from token_count import estimate_tokens  # noqa: E402
+
+LOG_PREFIX_RE = re.compile(r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d+ - \w+ - ")
+MESSAGE_RE = re.compile(r"The user's new message is: (?P<message>.*?)\n\nReply to this message", re.S)
+
+
+def load_turns(path):
+    """Return [(user_id, message, recorded_reply or None)] in log order."""
+    with open(path, encoding="utf-8") as file:
+        lines = [LOG_PREFIX_RE.sub("", line.rstrip("\n")) for line in file]
+
+    turns = []
+    user_id = None
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        if line.startswith("User ID: "):
+            user_id = line[len("User ID: "):].strip()
+        elif line.startswith("User Message: ") and user_id is not None:
+            turns.append([user_id, line[len("User Message: "):].strip(), None])
+        elif line.startswith("Gemini Response:") and turns:
+            reply = []
+            index += 1
+            while index < len(lines) and not lines[index].startswith("====="):
+                reply.append(lines[index])
+                index += 1
+            turns[-1][2] = "\n".join(reply).strip() or None
+        index += 1
+    return [tuple(turn) for turn in turns]
+
+
+class ReplayModel:
+    """Stands in for the Gemini model during the benchmark.
+
+    Waits `latency` seconds (plus up to `jitter`) per call and answers with
+    the next reply recorded for the same message, falling back to the stub
+    reply when the log has none. Records the size of every prompt.
+    """
+
+    def __init__(self, turns, latency: float, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.replies = defaultdict(deque)
+        for _, message, reply in turns:
+            if reply:
+                self.replies[message].append(reply)
+        self.prompt_chars = []
+        self.prompt_tokens = []
+
+    def _reply(self, prompt: str) -> str:
+        match = MESSAGE_RE.search(prompt)
+        recorded = self.replies.get(match.group("message")) if match else None
+        if recorded:
+            recorded.rotate(-1)
+            return recorded[-1]
+        return stub_reply(prompt)
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        prompt = str(contents)
+        self.prompt_chars.append(len(prompt))
+        self.prompt_tokens.append(estimate_tokens(prompt))
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        text = self._reply(prompt)
+        if stream:
+            return StubStream(text, delay)
+        await asyncio.sleep(delay)
+        return StubResponse(text)
+
+
+def reset_state():
+    # Every concurrency level starts from empty sessions and caches
+    main.SESSION_STORE = MemorySessionStore()
+    main.CONTEXT_BUILDER = ContextBuilder()
+    main.RESPONSE_CACHE = ResponseCache()
+    main.REPLY_PARSE_STATS = ParseStats()
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is a high-water mark, in kB on Linux and bytes on macOS
+        scale = 2 ** 20 if sys.platform == "darwin" else 2 ** 10
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def build_sessions(turns, copies, session_turns):
+    """Split each user's turns into sessions of `session_turns`, `copies` times over."""
+    by_user = OrderedDict()
+    for user_id, message, _ in turns:
+        by_user.setdefault(user_id, []).append(message)
+    sessions = OrderedDict()
+    for copy in range(copies):
+        for user_id, messages in by_user.items():
+            for start in range(0, len(messages), session_turns):
+                sessions[f"{user_id}#{copy}.{start // session_turns}"] = messages[start:start + session_turns]
+    return sessions
+
+
+async def replay(sessions, concurrency, endpoint):
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = defaultdict(int)
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=None) as client:
+        async def run_session(user_id, messages):
+            for message in messages:
+                async with slots:
+                    start = time.perf_counter()
+                    response = await client.post(endpoint, json={"user_id": user_id, "message": message})
+                    latencies.append((time.perf_counter() - start) * 1000)
+                statuses[response.status_code] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_session(user_id, messages) for user_id, messages in sessions.items()))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+async def replay_batches(sessions, concurrency, batch_size):
+    # The n-th turns of all sessions go out together, split into batches, so
+    # each session's turns are still sent in order. Latencies are per batch.
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = defaultdict(int)
+    transport = httpx.ASGITransport(app=main.app)
+    rounds = max(len(messages) for messages in sessions.values())
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=None) as client:
+        async def run_batch(batch):
+            async with slots:
+                start = time.perf_counter()
+                response = await client.post("/chat/batch", json={"messages": batch})
+                latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                statuses[response.status_code] += len(batch)
+                return
+            for result in response.json()["results"]:
+                statuses[result["status"]] += 1
+
+        start = time.perf_counter()
+        for turn in range(rounds):
+            messages = [{"user_id": user_id, "message": session[turn]}
+                        for user_id, session in sessions.items() if turn < len(session)]
+            await asyncio.gather(*(run_batch(messages[i:i + batch_size])
+                                   for i in range(0, len(messages), batch_size)))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+async def websocket_session(user_id, messages, latencies, statuses):
+    # Drives /ws/chat directly over ASGI, as httpx has no WebSocket client
+    inbox, outbox = asyncio.Queue(), asyncio.Queue()
+    scope = {"type": "websocket", "path": "/ws/chat", "raw_path": b"/ws/chat", "root_path": "",
+             "scheme": "ws", "query_string": urlencode({"user_id": user_id}).encode(), "headers": [],
+             "server": ("replay", 80), "client": ("127.0.0.1", 0), "subprotocols": [],
+             "asgi": {"version": "3.0"}}
+    await inbox.put({"type": "websocket.connect"})
+    app = asyncio.ensure_future(main.app(scope, inbox.get, outbox.put))
+    accepted = await outbox.get()
+    assert accepted["type"] == "websocket.accept", accepted
+    for message in messages:
+        start = time.perf_counter()
+        await inbox.put({"type": "websocket.receive", "text": json.dumps({"message": message})})
+        while True:
+            frame = json.loads((await outbox.get())["text"])
+            if frame["event"] in ("profiles", "error"):
+                break
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[200 if frame["event"] == "profiles" else 500] += 1
+    await inbox.put({"type": "websocket.disconnect", "code": 1000})
+    await app
+
+
+async def replay_websockets(sessions, concurrency):
+    # One connection per session; concurrency counts open connections
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = defaultdict(int)
+
+    async def run_session(user_id, messages):
+        async with slots:
+            await websocket_session(user_id, messages, latencies, statuses)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(user_id, messages) for user_id, messages in sessions.items()))
+    return latencies, statuses, time.perf_counter() - start
+
+
+async def run(args):
+    turns = load_turns(args.log)[:args.limit]
+    sessions = build_sessions(turns, args.copies, args.session_turns)
+    requests = sum(len(messages) for messages in sessions.values())
+    recorded = sum(1 for turn in turns if turn[2])
+    print(f"{len(turns)} turns ({recorded} with recorded replies) from {args.log}, "
+          f"{len(sessions)} sessions, {requests} requests per level, "
+          f"model latency {args.latency_ms:.0f}ms + up to {args.jitter_ms:.0f}ms\n")
+
+    header = (f"{'concurrency':>11}{'turns/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+              f"{'model calls':>13}{'prompt tok':>12}{'tok max':>9}{'rss +MB':>9}{'errors':>8}")
+    print(header)
+    results = []
+    # The transport below does not run the app's lifespan, so load here
+    main.PROFILES.load_now()
+    for concurrency in args.concurrency:
+        reset_state()
+        model = ReplayModel(turns, args.latency_ms / 1000, args.jitter_ms / 1000, args.seed)
+        gemini_client.model = model
+        rss_before = rss_mb()
+        if args.endpoint == "/ws/chat":
+            latencies, statuses, elapsed = await replay_websockets(sessions, concurrency)
+        elif args.endpoint == "/chat/batch":
+            latencies, statuses, elapsed = await replay_batches(sessions, concurrency, args.batch_size)
+        else:
+            latencies, statuses, elapsed = await replay(sessions, concurrency, args.endpoint)
+        rss_growth = rss_mb() - rss_before
+
+        errors = sum(count for status, count in statuses.items() if status >= 400)
+        turns_sent = sum(statuses.values())
+        result = {
+            "concurrency": concurrency,
+            "requests": len(latencies),
+            "turns": turns_sent,
+            "seconds": round(elapsed, 3),
+            "throughput_rps": round(turns_sent / elapsed, 2),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.50), 2),
+                "p95": round(percentile(latencies, 0.95), 2),
+                "p99": round(percentile(latencies, 0.99), 2),
+                "max": round(max(latencies), 2),
+            },
+            "model_calls": len(model.prompt_tokens),
+            "prompt_tokens": {
+                "mean": round(statistics.mean(model.prompt_tokens), 1) if model.prompt_tokens else 0,
+                "max": max(model.prompt_tokens, default=0),
+            },
+            "prompt_chars_mean": round(statistics.mean(model.prompt_chars), 1) if model.prompt_chars else 0,
+            "rss_growth_mb": round(rss_growth, 2),
+            "statuses": dict(statuses),
+            "reply_parsing": main.REPLY_PARSE_STATS.stats(),
+        }
+        results.append(result)
+        print(f"{concurrency:>11}{result['throughput_rps']:>9.1f}"
+              f"{result['latency_ms']['p50']:>7.0f}ms{result['latency_ms']['p95']:>7.0f}ms"
+              f"{result['latency_ms']['p99']:>7.0f}ms{result['model_calls']:>13}"
+              f"{result['prompt_tokens']['mean']:>12.0f}{result['prompt_tokens']['max']:>9}"
+              f"{rss_growth:>9.1f}{errors:>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"args": vars(args), "results": results}, file, indent=2)
+        print(f"\nwrote {args.json}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", default="chat.log")
+    parser.add_argument("--limit", type=int, default=None, help="only replay the first N turns")
+    parser.add_argument("--copies", type=int, default=8,
+                        help="replay the log this many times under distinct user ids")
+    parser.add_argument("--session-turns", type=int, default=10,
+                        help="split each user's turns into sessions of this many turns")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64],
+                        help="in-flight request limits to measure")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="fake model latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="random extra latency per call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--endpoint", default="/chat", choices=["/chat", "/chat/stream", "/chat/batch", "/ws/chat"])
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="turns per request with --endpoint /chat/batch")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own log")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,117 @@
+"""Prompt size and latency with and without top-k profile retrieval.
+
+Replays the user messages recorded in chat.log and builds the prompt
+twice: once with the full catalog (the old behaviour) and once with only
+the retrieved candidates.
+
+    python benchmarks/bench_retrieval.py            # offline, simulated model
+    python benchmarks/bench_retrieval.py --live     # real Gemini calls
+
+Offline, token counts come from token_count.estimate_tokens and the model
+is simulated with a fixed round trip plus a per-input-token cost. --live
+uses Gemini's count_tokens and times real generate_content_async calls.
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import main  # noqa: E402
+from session_store import MemorySessionStore  # noqa: E402
+from token_count import estimate_tokens  # noqa: E402
+
+TURN_RE = re.compile(r"User ID: (?P<user_id>.*)\n.*User Message: (?P<message>.*)")
+
+
+def load_turns(path):
+    with open(path, encoding="utf-8") as file:
+        text = file.read()
+    return [(m.group("user_id").strip(), m.group("message").strip()) for m in TURN_RE.finditer(text)]
+
+
+def build_prompts(turns):
+    """Yield (full_prompt, retrieved_prompt) per turn, replaying history as we go."""
+    main.SESSION_STORE = MemorySessionStore()
+    main.PROFILES.load_now()
+    snapshot = main.PROFILES.current
+    for user_id, message_text in turns:
+        message = main.ChatMessage(message=message_text, user_id=user_id)
+        history = main.SESSION_STORE.get(user_id)
+        context = main.get_conversation_context(user_id, history)
+        start = time.perf_counter()
+        retrieved = main.get_profiles_data(message, history, snapshot)
+        retrieval_ms = (time.perf_counter() - start) * 1000
+        yield (main.build_prompt(message, context, snapshot.profiles_data),
+               main.build_prompt(message, context, retrieved),
+               retrieval_ms)
+        main.save_turn(user_id, message_text, "Ok.")
+
+
+async def simulated_call(tokens, base_ms, per_1k_tokens_ms):
+    start = time.perf_counter()
+    await asyncio.sleep((base_ms + tokens / 1000 * per_1k_tokens_ms) / 1000)
+    return (time.perf_counter() - start) * 1000
+
+
+async def live_call(prompt):
+    start = time.perf_counter()
+    await main.generate_text(prompt)
+    return (time.perf_counter() - start) * 1000
+
+
+async def run(args):
+    turns = load_turns(args.log)[:args.limit]
+    rows = list(build_prompts(turns))
+    print(f"{len(rows)} turns from {args.log}\n")
+
+    results = {}
+    for label, index in (("full catalog", 0), ("top-k retrieval", 1)):
+        prompts = [row[index] for row in rows]
+        if args.live:
+            import gemini_client
+            gemini_client.build_model()
+            tokens = [gemini_client.get_model().count_tokens(str(p)).total_tokens for p in prompts]
+            latencies = [await live_call(p) for p in prompts]
+        else:
+            tokens = [estimate_tokens(str(p)) for p in prompts]
+            latencies = await asyncio.gather(
+                *(simulated_call(t, args.base_ms, args.per_1k_tokens_ms) for t in tokens))
+        results[label] = (tokens, latencies)
+
+    retrieval_ms = [row[2] for row in rows]
+    print(f"{'':18}{'tokens mean':>12}{'tokens max':>12}{'latency p50':>13}{'latency p95':>13}")
+    for label, (tokens, latencies) in results.items():
+        latencies = sorted(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{label:18}{statistics.mean(tokens):12.0f}{max(tokens):12d}"
+              f"{statistics.median(latencies):11.0f}ms{p95:11.0f}ms")
+    before = statistics.mean(results["full catalog"][0])
+    after = statistics.mean(results["top-k retrieval"][0])
+    print(f"\nprompt tokens reduced by {100 * (1 - after / before):.1f}%")
+    print(f"retrieval cost per turn: mean {statistics.mean(retrieval_ms):.3f}ms, "
+          f"max {max(retrieval_ms):.3f}ms")
+    if not args.live:
+        print(f"(latency simulated as {args.base_ms:.0f}ms + {args.per_1k_tokens_ms:.0f}ms per 1k input tokens)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", default="chat.log")
+    parser.add_argument("--limit", type=int, default=None, help="only replay the first N turns")
+    parser.add_argument("--live", action="store_true", help="call Gemini instead of simulating it")
+    parser.add_argument("--base-ms", type=float, default=600.0,
+                        help="simulated fixed round trip per call")
+    parser.add_argument("--per-1k-tokens-ms", type=float, default=120.0,
+                        help="simulated cost of each 1k prompt tokens")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
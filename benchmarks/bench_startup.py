@@ -0,0 +1,136 @@
+"""Cold start of a worker: import time of main.py and time until /readyz passes.
+
+Every run is a fresh interpreter, so nothing is cached in sys.modules.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --json startup.json
+    python benchmarks/bench_startup.py --importtime     # slowest imports of one run
+    python benchmarks/bench_startup.py --live           # real key, real warm-up call
+
+Offline, the real google.generativeai SDK is imported and the model
+built with a placeholder key, but the warm-up call is switched off, so
+nothing reaches the network. --live uses GEMINI_API_KEY (or config.py)
+and includes the warm-up call. The report shows interpreter start,
+`import main`, the catalog and model steps the lifespan hook runs in the
+background, and the total from process start to ready.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child: import main, run its lifespan and wait for readiness
+CHILD = """
+import time
+imported_at = time.perf_counter()
+import main
+imported = time.perf_counter() - imported_at
+import asyncio, json
+
+async def wait_ready():
+    async with main.app.router.lifespan_context(main.app):
+        while not main.READINESS.ready and main.READINESS.status != "failed":
+            await asyncio.sleep(0.001)
+        return time.perf_counter() - imported_at - imported
+
+after_import = asyncio.run(wait_ready())
+print(json.dumps({"import": imported, "ready_after_import": after_import,
+                  "started_at": imported_at, **main.READINESS.stats()}))
+"""
+
+
+def child_env(live):
+    env = dict(os.environ, LOG_FILE=os.devnull, PYTHONPATH=ROOT, PROFILES_RELOAD_INTERVAL="0")
+    env.pop("GEMINI_STUB", None)
+    if not live:
+        env["GEMINI_API_KEY"] = "offline-benchmark"
+        env["MODEL_WARMUP"] = "0"
+    return env
+
+
+def run_once(live):
+    spawned = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=child_env(live),
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.splitlines()[-1])
+    # perf_counter is system-wide on Linux, so the child's clock lines up with ours
+    result["interpreter"] = result.pop("started_at") - spawned
+    result["total"] = result["interpreter"] + result["import"] + result["ready_after_import"]
+    return result
+
+
+def slowest_imports(live, limit):
+    """(cumulative seconds, module) of the slowest imports below main."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT,
+                            env=child_env(live), capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and name.startswith("   ") and not name.startswith("    "):
+            # Indented once: imported by main itself
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def step_seconds(result, step):
+    return result["steps"].get(step, {}).get("seconds")
+
+
+def ms(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return f"{'-':>10}"
+    return f"{statistics.median(values) * 1000:>8.1f}ms"
+
+
+def main():
+    args = parse_args()
+    results = [run_once(args.live) for _ in range(args.runs)]
+    failed = [r for r in results if r["status"] != "ready"]
+    if failed:
+        sys.exit(f"worker did not become ready: {failed[0]['steps']}")
+
+    print(f"{args.runs} cold starts, {'live' if args.live else 'offline'}, medians\n")
+    columns = [
+        ("interpreter", [r["interpreter"] for r in results]),
+        ("import main", [r["import"] for r in results]),
+        ("catalog", [step_seconds(r, "catalog") for r in results]),
+        ("model", [step_seconds(r, "model") for r in results]),
+        ("warm-up", [step_seconds(r, "warmup") for r in results]),
+        ("to ready", [r["ready_after_import"] for r in results]),
+        ("total", [r["total"] for r in results]),
+    ]
+    print("".join(f"{name:>12}" for name, _ in columns))
+    print("".join(f"{ms(values):>12}" for _, values in columns))
+
+    if args.importtime:
+        print("\nslowest imports of main.py (cumulative):")
+        for seconds, name in slowest_imports(args.live, args.top):
+            print(f"{seconds * 1000:>10.1f}ms  {name}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"args": vars(args), "results": results}, file, indent=2)
+        print(f"\nwrote {args.json}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to measure")
+    parser.add_argument("--live", action="store_true", help="use the real API key and warm-up call")
+    parser.add_argument("--importtime", action="store_true",
+                        help="also list the slowest modules main.py imports")
+    parser.add_argument("--top", type=int, default=10, help="modules to list with --importtime")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from intent_router import IntentRouter
+from profile_catalog import ProfileCatalog, parse_profiles
+from profile_index import PROFILE_INDEX_PATH, ProfileIndex
+from retrieval import ProfileRetriever
+from structured_log import log
+
+PROFILES_PATH = os.getenv("PROFILES_PATH", "profiles.txt")
+# Seconds between checks of profiles.txt for changes; 0 turns reloading off
+PROFILES_RELOAD_INTERVAL = float(os.getenv("PROFILES_RELOAD_INTERVAL", "5"))
+# Seconds between attempts while profiles.txt cannot be loaded at startup
+STARTUP_RETRY_INTERVAL = 5.0
+
+
+class CatalogNotLoaded(RuntimeError):
+    """`current` was read before the first snapshot was built."""
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """One version of profiles.txt together with everything derived from it."""
+    catalog: ProfileCatalog
+    profiles_data: str
+    retriever: ProfileRetriever
+    router: IntentRouter
+
+    @property
+    def version(self) -> str:
+        return self.catalog.version
+
+    @classmethod
+    def build(cls, catalog: ProfileCatalog, retriever: Optional[ProfileRetriever] = None) -> "CatalogSnapshot":
+        return cls(catalog, catalog.render(), retriever or ProfileRetriever(catalog), IntentRouter(catalog))
+
+
+class CatalogWatcher:
+    """Keeps `current` in step with profiles.txt.
+
+    watch() compares the file's mtime and size every interval. When they
+    change, the file is read and parsed in a worker thread, and only a
+    catalog whose content hash differs is turned into a new snapshot.
+    The swap is a single attribute assignment on the event loop, so a
+    request that read `current` once keeps a consistent snapshot even if
+    a reload lands while it waits for the model. A file that parses to no
+    profiles is rejected and the old snapshot stays.
+
+    With a prebuilt index from ingest.py, startup uses its catalog and
+    memory-mapped retrieval arrays as long as profiles.txt is unchanged.
+    Edits to profiles.txt are merged with the index's ingested entries.
+
+    Nothing is read when the watcher is created. load() builds the first
+    snapshot in a worker thread; until then `loaded` is False and reading
+    `current` raises CatalogNotLoaded.
+    """
+
+    def __init__(self, path: str = PROFILES_PATH, interval: float = PROFILES_RELOAD_INTERVAL,
+                 index_path: str = PROFILE_INDEX_PATH):
+        self.path = path
+        self.interval = interval
+        self.index_path = index_path
+        self._signature: Optional[Tuple[int, int]] = None
+        self.index: Optional[ProfileIndex] = None
+        self._current: Optional[CatalogSnapshot] = None
+        self._load_lock = threading.Lock()
+        self._listeners: List[Callable[[CatalogSnapshot, CatalogSnapshot], None]] = []
+        self.reloads = 0
+        self.failures = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._current is not None
+
+    @property
+    def current(self) -> CatalogSnapshot:
+        if self._current is None:
+            raise CatalogNotLoaded("the profile catalog has not been loaded yet")
+        return self._current
+
+    def load_now(self):
+        """Build the first snapshot on this thread, for scripts without the app's lifespan."""
+        with self._load_lock:
+            if self._current is not None:
+                return
+            self._signature = self._stat()
+            self.index = ProfileIndex.load(self.index_path) if self.index_path else None
+            self._current = self._startup_snapshot()
+
+    async def load(self) -> float:
+        """Build the first snapshot off the event loop. Returns the seconds it took.
+
+        Raises OSError or ValueError when profiles.txt cannot be read or
+        holds no profiles.
+        """
+        start = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, self.load_now)
+        return time.perf_counter() - start
+
+    def _startup_snapshot(self) -> CatalogSnapshot:
+        # Unlike a reload there is no old snapshot to keep, so a file that
+        # cannot be read or holds no profiles fails the load
+        with open(self.path, "r", encoding="utf-8") as file:
+            text = file.read()
+        if self.index is not None:
+            if self.index.matches(text):
+                catalog = self.index.catalog()
+                return CatalogSnapshot.build(catalog, self.index.retriever(catalog))
+            log.warning("profile_index_stale", path=self.index.path, profiles_path=self.path)
+        return CatalogSnapshot.build(self._parse(text))
+
+    def _parse(self, text: str) -> ProfileCatalog:
+        # Checked before merging: the ingested entries alone would fill the
+        # catalog even if profiles.txt were truncated or garbled
+        primary = parse_profiles(text)
+        if not primary:
+            raise ValueError("no profiles could be parsed")
+        if self.index is None:
+            return ProfileCatalog.from_text(text, primary)
+        return self.index.merge(text, primary)
+
+    def on_swap(self, listener: Callable[[CatalogSnapshot, CatalogSnapshot], None]):
+        """Call `listener(old, new)` after every swap, e.g. to drop caches."""
+        self._listeners.append(listener)
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load_if_changed(self) -> Optional[CatalogSnapshot]:
+        # Runs in a worker thread; parsing and indexing stay off the event loop
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return None
+        self._signature = signature
+        with open(self.path, "r", encoding="utf-8") as file:
+            catalog = self._parse(file.read())
+        if catalog.version == self.current.version:
+            return None
+        return CatalogSnapshot.build(catalog)
+
+    def swap(self, snapshot: CatalogSnapshot):
+        old = self.current
+        # The fast-path counters carry on across versions
+        snapshot.router.lookups = old.router.lookups
+        snapshot.router.hits = old.router.hits
+        snapshot.router.hits_by_intent = dict(old.router.hits_by_intent)
+        self._current = snapshot
+        self.reloads += 1
+        for listener in self._listeners:
+            listener(old, snapshot)
+        log.info("catalog_reloaded", path=self.path, old_version=old.version,
+                 version=snapshot.version, profiles=len(snapshot.catalog))
+
+    async def check(self) -> bool:
+        """Reload if the file changed. Returns True when a new snapshot was swapped in."""
+        loop = asyncio.get_running_loop()
+        try:
+            snapshot = await loop.run_in_executor(None, self._load_if_changed)
+        except Exception as e:
+            self.failures += 1
+            log.error("catalog_reload_failed", path=self.path, error=str(e))
+            return False
+        if snapshot is None:
+            return False
+        self.swap(snapshot)
+        return True
+
+    async def watch(self):
+        if self.interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    def stats(self) -> dict:
+        return {
+            "version": self._current.version if self._current else None,
+            "index": self.index.version if self.index else None,
+            "profiles": len(self._current.catalog) if self._current else 0,
+            "reloads": self.reloads,
+            "failures": self.failures,
+        }
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from profile_catalog import Profile
+from structured_log import log
+
+# Seconds a /ws/chat connection may stay silent before it is closed
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "300"))
+# Messages that may wait while a turn is answered; more are refused
+WS_MAX_PENDING = int(os.getenv("WS_MAX_PENDING", "4"))
+# Seconds one send may wait on a client that is not reading before it is dropped
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+NORMAL_CLOSURE = 1000
+
+TurnEvents = Callable[["ChatSession", str], AsyncIterator[Tuple[str, dict]]]
+
+
+class ChatSession:
+    """What one /ws/chat connection keeps between turns.
+
+    The user_id is fixed when the socket opens, so turns only carry their
+    text. The session remembers the conversation's language and the
+    retrieval candidates of the last turn that searched. A follow-up
+    that names nothing in the catalog, like "hoo" or "somwari 1 vajta",
+    reuses those candidates and their prompt text instead of searching
+    again, and a message too short to show a language keeps the one the
+    conversation had. The conversation context itself is assembled
+    incrementally by ContextBuilder, keyed by user_id.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.turns = 0
+        self.language: Optional[str] = None
+        # Catalog version the candidates were searched in
+        self.catalog_version: Optional[str] = None
+        self.candidates: List[Tuple[Profile, float]] = []
+        self.profiles_data = ""
+        # The reader and the turn both send frames; one send at a time
+        self.send_lock = asyncio.Lock()
+
+    def remember_candidates(self, catalog_version: str, candidates: List[Tuple[Profile, float]],
+                            profiles_data: str):
+        self.catalog_version = catalog_version
+        self.candidates = candidates
+        self.profiles_data = profiles_data
+
+
+class ChatSessions:
+    """Serves /ws/chat connections and counts what happens to them.
+
+    A reader task takes incoming messages into a small queue, so a
+    disconnect is noticed even while a turn is being answered, and the
+    turn is cancelled along with its model call. Each send waits for the
+    client to take the previous frames, which is what throttles the model
+    stream for a slow reader; a client that stops reading for
+    WS_SEND_TIMEOUT is disconnected. Messages arriving while
+    WS_MAX_PENDING are already waiting are refused with an error event.
+    Both tasks send through the session's send lock, so their frames
+    never interleave on the socket.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.opened = 0
+        self.turns = 0
+        self.refused = 0
+        self.idle_closed = 0
+        self.slow_closed = 0
+        # Follow-up turns that reused the previous turn's retrieval candidates
+        self.candidates_reused = 0
+
+    def __len__(self) -> int:
+        return self.active
+
+    @staticmethod
+    async def _send(websocket: WebSocket, session: ChatSession, event: str, data: dict):
+        frame = json.dumps({"event": event, "data": data}, ensure_ascii=False)
+        async with session.send_lock:
+            await asyncio.wait_for(websocket.send_text(frame), WS_SEND_TIMEOUT)
+
+    async def serve(self, websocket: WebSocket, user_id: str, turn_events: TurnEvents):
+        await websocket.accept()
+        session = ChatSession(user_id)
+        self.active += 1
+        self.opened += 1
+        inbox: asyncio.Queue = asyncio.Queue(WS_MAX_PENDING)
+
+        async def read():
+            while True:
+                text = await websocket.receive_text()
+                try:
+                    inbox.put_nowait(text)
+                except asyncio.QueueFull:
+                    self.refused += 1
+                    await self._send(websocket, session, "error", {"detail": "Too many messages waiting, please resend"})
+
+        reader = asyncio.create_task(read())
+        try:
+            while True:
+                incoming = asyncio.ensure_future(inbox.get())
+                done, _ = await asyncio.wait({incoming, reader}, timeout=WS_IDLE_TIMEOUT,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if incoming not in done:
+                    incoming.cancel()
+                    if not done:
+                        self.idle_closed += 1
+                        await websocket.close(NORMAL_CLOSURE, "idle timeout")
+                    return
+                turn = asyncio.ensure_future(self._turn(websocket, session, incoming.result(), turn_events))
+                done, _ = await asyncio.wait({turn, reader}, return_when=asyncio.FIRST_COMPLETED)
+                if turn not in done:
+                    # The client left mid-turn; stop generating for nobody
+                    turn.cancel()
+                    return
+                turn.result()
+        except asyncio.TimeoutError:
+            self.slow_closed += 1
+            log.warning("websocket_slow_client", user_id=user_id)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.active -= 1
+            reader.cancel()
+            if reader.done() and not reader.cancelled() and not isinstance(reader.exception(), WebSocketDisconnect):
+                log.warning("websocket_read_failed", user_id=user_id, error=repr(reader.exception()))
+
+    async def _turn(self, websocket: WebSocket, session: ChatSession, text: str, turn_events: TurnEvents):
+        try:
+            message = json.loads(text)["message"]
+            if not isinstance(message, str) or not message.strip():
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            await self._send(websocket, session, "error", {"detail": 'Send {"message": "..."}'})
+            return
+        session.turns += 1
+        self.turns += 1
+        async for event, data in turn_events(session, message):
+            await self._send(websocket, session, event, data)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "opened": self.opened,
+            "turns": self.turns,
+            "refused_messages": self.refused,
+            "idle_closed": self.idle_closed,
+            "slow_closed": self.slow_closed,
+            "candidates_reused": self.candidates_reused,
+        }
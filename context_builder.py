@@ -0,0 +1,143 @@
+import os
+import re
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from token_count import estimate_tokens
+
+# Estimated tokens the conversation context may use in the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Most recent turns that are always replayed word for word
+CONTEXT_VERBATIM_TURNS = int(os.getenv("CONTEXT_VERBATIM_TURNS", "4"))
+# Sessions whose assembled context is kept between turns
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "10000"))
+
+SUMMARY_USER_CHARS = 80
+SUMMARY_ASSISTANT_CHARS = 120
+SENTENCE_END_RE = re.compile(r"(?<=[.?!।])\s")
+
+
+def _turn_key(turn: dict) -> Tuple[str, str]:
+    return (turn.get("timestamp", ""), turn["user_message"])
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def summarize_turn(turn: dict) -> str:
+    """One summary line: the user's request and the first sentence of the reply."""
+    reply = SENTENCE_END_RE.split(turn["assistant_response"].strip(), 1)[0]
+    return (f"- User: {_shorten(turn['user_message'], SUMMARY_USER_CHARS)}"
+            f" / Assistant: {_shorten(reply, SUMMARY_ASSISTANT_CHARS)}")
+
+
+def render_turn(turn: dict) -> str:
+    return f"User: {turn['user_message']}\nAssistant: {turn['assistant_response']}\n"
+
+
+class _Piece:
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = estimate_tokens(text)
+
+
+class _SessionContext:
+    __slots__ = ("last_key", "summary", "recent", "text")
+
+    def __init__(self):
+        self.last_key: Optional[Tuple[str, str]] = None
+        self.summary: List[_Piece] = []
+        self.recent: List[Tuple[dict, _Piece]] = []
+        self.text = ""
+
+
+class ContextBuilder:
+    """Builds the conversation part of the prompt within a token budget.
+
+    The last CONTEXT_VERBATIM_TURNS turns are replayed as-is. Older turns
+    are folded into a rolling one-line-per-turn summary, and the oldest
+    summary lines are dropped once the budget is exceeded. State is kept
+    per session, so each new turn only renders itself; an unchanged
+    session gets its cached text back.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 verbatim_turns: int = CONTEXT_VERBATIM_TURNS,
+                 max_sessions: int = CONTEXT_CACHE_SIZE):
+        self.token_budget = token_budget
+        self.verbatim_turns = verbatim_turns
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionContext]" = OrderedDict()
+        self.hits = 0
+        self.rebuilds = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def build(self, user_id: str, turns: List[dict]) -> str:
+        if not turns:
+            self._sessions.pop(user_id, None)
+            return ""
+
+        state = self._sessions.get(user_id)
+        new_turns = self._new_turns(state, turns)
+        if new_turns is None:
+            # Unknown session or history we cannot line up: start over
+            self.rebuilds += 1
+            state = self._sessions[user_id] = _SessionContext()
+            new_turns = turns
+        self._sessions.move_to_end(user_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+        if not new_turns:
+            self.hits += 1
+            return state.text
+
+        for turn in new_turns:
+            state.recent.append((turn, _Piece(render_turn(turn))))
+        state.last_key = _turn_key(turns[-1])
+        while len(state.recent) > self.verbatim_turns:
+            turn, _ = state.recent.pop(0)
+            state.summary.append(_Piece(summarize_turn(turn)))
+        self._fit_budget(state)
+        state.text = self._render(state)
+        return state.text
+
+    def _new_turns(self, state: Optional[_SessionContext], turns: List[dict]) -> Optional[List[dict]]:
+        if state is None or state.last_key is None:
+            return None
+        for index in range(len(turns) - 1, -1, -1):
+            if _turn_key(turns[index]) == state.last_key:
+                return turns[index + 1:]
+        return None
+
+    def _fit_budget(self, state: _SessionContext):
+        def used() -> int:
+            return sum(p.tokens for p in state.summary) + sum(p.tokens for _, p in state.recent)
+
+        while used() > self.token_budget and state.summary:
+            state.summary.pop(0)
+        # A few very long replies can still overflow; summarize all but the newest
+        while used() > self.token_budget and len(state.recent) > 1:
+            turn, _ = state.recent.pop(0)
+            state.summary.append(_Piece(summarize_turn(turn)))
+            while used() > self.token_budget and len(state.summary) > 1:
+                state.summary.pop(0)
+
+    @staticmethod
+    def _render(state: _SessionContext) -> str:
+        parts = []
+        if state.summary:
+            parts.append("\nSummary of earlier conversation:\n")
+            parts.extend(piece.text + "\n" for piece in state.summary)
+        parts.append("\nPrevious conversation:\n")
+        parts.extend(piece.text for _, piece in state.recent)
+        return "".join(parts)
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions), "hits": self.hits, "rebuilds": self.rebuilds}
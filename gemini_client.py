@@ -0,0 +1,379 @@
+import asyncio
+import contextlib
+import datetime
+import inspect
+import os
+import threading
+import time
+from typing import Optional, Union
+
+from google.api_core import exceptions as google_exceptions
+
+from metrics import MODEL_ERRORS
+from prompt_template import PROMPT_PREFIX, Prompt
+from resilience import MODEL_DEADLINE, ModelUnavailable, ResilientCaller, backoff_delay
+from structured_log import log
+
+# How many Gemini calls one worker may have in flight at the same time
+MAX_CONCURRENT_MODEL_CALLS = int(os.getenv("MAX_CONCURRENT_MODEL_CALLS", "32"))
+# Seconds before a single Gemini call is abandoned
+MODEL_CALL_TIMEOUT = float(os.getenv("MODEL_CALL_TIMEOUT", "30"))
+# How often to check whether the HTTP client is still connected
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.25"))
+# Answer with the local stub model instead of calling Gemini
+GEMINI_STUB = os.getenv("GEMINI_STUB", "0") == "1"
+# Upload the static prompt prefix once as Gemini cached content
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+# Lifetime of the cached prefix; it is refreshed well before it runs out
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# Ask for JSON matching the reply schema on non-streaming calls
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "1") == "1"
+# Gemini API key; a GEMINI_API_KEY in config.py is still used when this is unset
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+# Send a one-token request at startup so the first user does not pay for connection setup
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+
+MODEL_NAME = 'gemini-2.0-flash'
+GENERATION_CONFIG = {
+    'temperature': 0.2,  # Lower temperature for more consistent responses
+    'top_p': 0.8,       # Focus on most likely tokens
+    'top_k': 40,        # Consider fewer tokens
+    'max_output_tokens': 1024,
+}
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
+
+# Built by init_model() at startup. Importing google.generativeai alone
+# takes about half a second, so it only happens then, off the event loop.
+model = None
+_model_lock = threading.Lock()
+
+# Older SDKs (like the pinned 0.3.1) cannot constrain output to a schema;
+# set once the SDK is imported
+SUPPORTS_RESPONSE_SCHEMA = GEMINI_STUB
+
+# Caps in-flight model calls so a burst cannot open unlimited connections
+model_call_slots = asyncio.Semaphore(MAX_CONCURRENT_MODEL_CALLS)
+
+# Model bound to the cached prefix, or None to send whole prompts; the
+# cached content behind it and when (time.monotonic()) that expires
+cached_prefix_model = None
+cached_content = None
+cached_content_expires = 0.0
+# First wait after a failed upload of the prefix; it doubles per failure
+CONTEXT_CACHE_RETRY_DELAY = 5.0
+
+# Errors worth another attempt: time-outs, rate limits and server-side failures.
+# Anything else (a bad request, a blocked reply) would fail the same way again.
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+)
+
+# Retries, hedging and the circuit breaker around every Gemini call
+MODEL_CALLS = ResilientCaller(RETRYABLE_ERRORS)
+
+
+class ClientDisconnected(Exception):
+    """The HTTP client went away before the model answered."""
+
+
+def api_key() -> str:
+    if GEMINI_API_KEY:
+        return GEMINI_API_KEY
+    try:
+        from config import GEMINI_API_KEY as key
+    except ImportError:
+        key = ""
+    if not key:
+        raise RuntimeError("GEMINI_API_KEY is not set")
+    return key
+
+
+def _create_model():
+    global SUPPORTS_RESPONSE_SCHEMA
+    if GEMINI_STUB:
+        from stub_model import StubModel
+        return StubModel()
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key())
+    SUPPORTS_RESPONSE_SCHEMA = "response_schema" in inspect.signature(genai.GenerationConfig).parameters
+    return genai.GenerativeModel(MODEL_NAME,
+        generation_config=GENERATION_CONFIG,
+        safety_settings=SAFETY_SETTINGS,
+    )
+
+
+def build_model():
+    """Build the model on this thread if it is not built yet.
+
+    init_model() runs this in a worker thread; scripts that use the app
+    without its lifespan call it directly. Raises ModelUnavailable when
+    the model cannot be built, e.g. without an API key.
+    """
+    global model
+    with _model_lock:
+        if model is None:
+            try:
+                model = _create_model()
+            except Exception as e:
+                raise ModelUnavailable(f"model could not be initialised: {e}") from e
+    return model
+
+
+def model_ready() -> bool:
+    return model is not None
+
+
+def get_model():
+    """The model. Raises ModelUnavailable until init_model() has built it."""
+    if model is None:
+        raise ModelUnavailable("the model has not been initialised yet")
+    return model
+
+
+async def init_model() -> float:
+    """Import the SDK and build the model in a worker thread.
+
+    Returns the seconds it took. Raises ModelUnavailable on failure.
+    """
+    start = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, build_model)
+    return time.perf_counter() - start
+
+
+async def warm_up_model() -> Optional[float]:
+    """Open the connection to Gemini with a request for a single token.
+
+    This goes through the same async client every later call uses
+    (count_tokens_async would be free, but 0.3.1 sends it through the
+    sync client). Returns the seconds it took, or None when MODEL_WARMUP
+    is off. Errors are left to the caller; the model works without it.
+    """
+    if not MODEL_WARMUP:
+        return None
+    start = time.perf_counter()
+    config = dict(GENERATION_CONFIG, max_output_tokens=1)
+    await asyncio.wait_for(get_model().generate_content_async("ping", generation_config=config),
+                           MODEL_CALL_TIMEOUT)
+    return time.perf_counter() - start
+
+
+def context_cache_supported() -> bool:
+    """Whether GEMINI_CONTEXT_CACHE is on and the SDK has genai.caching."""
+    if GEMINI_STUB or not GEMINI_CONTEXT_CACHE:
+        return False
+    import google.generativeai as genai
+
+    return hasattr(genai, "caching")
+
+
+def refresh_context_cache():
+    """Upload PROMPT_PREFIX as new cached content and bind a model to it.
+
+    Returns the cached content this replaces, or None. Raises when the
+    upload fails, in which case the previous one stays in use.
+    """
+    global cached_prefix_model, cached_content, cached_content_expires
+    import google.generativeai as genai
+
+    # genai.configure() runs when the model is built
+    get_model()
+    cached = genai.caching.CachedContent.create(
+        model=MODEL_NAME,
+        system_instruction=PROMPT_PREFIX,
+        ttl=datetime.timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL),
+    )
+    try:
+        bound = genai.GenerativeModel.from_cached_content(
+            cached, generation_config=GENERATION_CONFIG, safety_settings=SAFETY_SETTINGS,
+        )
+    except Exception:
+        _delete_cached_content(cached)
+        raise
+    previous = cached_content
+    cached_prefix_model, cached_content = bound, cached
+    cached_content_expires = time.monotonic() + GEMINI_CONTEXT_CACHE_TTL
+    return previous
+
+
+def _delete_cached_content(cached):
+    # Caches are billed until they expire, so replaced ones go straight away
+    try:
+        cached.delete()
+    except Exception as e:
+        log.warning("context_cache_delete_failed", error=str(e))
+
+
+async def keep_context_cache_fresh():
+    """Background task: re-upload the prefix at half its TTL.
+
+    A failed upload is retried with backoff while the previous cache keeps
+    serving; whole prompts are sent once it is about to expire. A replaced
+    cache is deleted as soon as no call can still be using it.
+    """
+    global cached_prefix_model, cached_content
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, context_cache_supported):
+        return
+    failures = 0
+    while True:
+        try:
+            previous = await loop.run_in_executor(None, refresh_context_cache)
+        except Exception as e:
+            failures += 1
+            log.warning("context_cache_unavailable", error=str(e), failures=failures)
+            if cached_content is not None and time.monotonic() > cached_content_expires - MODEL_DEADLINE:
+                # It runs out before a call started now would finish
+                cached_prefix_model, cached_content = None, None
+            await asyncio.sleep(backoff_delay(failures, CONTEXT_CACHE_RETRY_DELAY, GEMINI_CONTEXT_CACHE_TTL / 2))
+            continue
+        failures = 0
+        grace = min(MODEL_DEADLINE, GEMINI_CONTEXT_CACHE_TTL / 2)
+        if previous is not None:
+            # Calls that picked the old model before the swap finish first
+            await asyncio.sleep(grace)
+            await loop.run_in_executor(None, _delete_cached_content, previous)
+        else:
+            grace = 0
+        await asyncio.sleep(GEMINI_CONTEXT_CACHE_TTL / 2 - grace)
+
+
+def _model_and_contents(prompt: Union[Prompt, str]):
+    # With the prefix cached server-side only the per-request suffix is sent
+    if (cached_prefix_model is not None and isinstance(prompt, Prompt)
+            and prompt.prefix == PROMPT_PREFIX):
+        return cached_prefix_model, prompt.suffix
+    return get_model(), str(prompt)
+
+
+async def _wait_for_disconnect(request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+def structured_output_enabled() -> bool:
+    return STRUCTURED_OUTPUT and SUPPORTS_RESPONSE_SCHEMA
+
+
+@contextlib.contextmanager
+def _count_errors():
+    # Cancellation is the caller leaving, not a model failure
+    try:
+        yield
+    except asyncio.TimeoutError:
+        MODEL_ERRORS.inc("timeout")
+        raise
+    except Exception:
+        MODEL_ERRORS.inc("error")
+        raise
+
+
+async def _generate_once(selected, contents, options: dict) -> str:
+    with _count_errors():
+        async with model_call_slots:
+            response = await asyncio.wait_for(
+                selected.generate_content_async(contents, **options), MODEL_CALL_TIMEOUT
+            )
+        return response.text
+
+
+async def _generate(prompt: Union[Prompt, str], response_schema: Optional[dict] = None) -> str:
+    selected, contents = _model_and_contents(prompt)
+    options = {}
+    if response_schema is not None and structured_output_enabled():
+        options["generation_config"] = dict(
+            GENERATION_CONFIG, response_mime_type="application/json", response_schema=response_schema
+        )
+    return await MODEL_CALLS.call(lambda: _generate_once(selected, contents, options))
+
+
+async def cancel_on_disconnect(awaitable, request):
+    """Await `awaitable`, cancelling it as soon as the request's client disconnects.
+
+    Raises ClientDisconnected in that case. Without a request it just awaits.
+    """
+    if request is None:
+        return await awaitable
+    call = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({call, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not call.done():
+            call.cancel()
+    if call not in done:
+        raise ClientDisconnected()
+    return call.result()
+
+
+async def generate_text(prompt: Union[Prompt, str], request=None,
+                        response_schema: Optional[dict] = None) -> str:
+    """Run one Gemini call without blocking the event loop.
+
+    Waits for a free slot, applies MODEL_CALL_TIMEOUT to each attempt and
+    retries, hedges and trips the circuit breaker as MODEL_CALLS is set up
+    to. When a request is given, the call is cancelled as soon as its
+    client disconnects. With a response_schema, and an SDK that supports
+    it, the reply is JSON matching that schema. Raises ModelUnavailable
+    when Gemini cannot answer, or ClientDisconnected.
+    """
+    return await cancel_on_disconnect(_generate(prompt, response_schema), request)
+
+
+async def stream_text(prompt: Union[Prompt, str]):
+    """Yield the Gemini reply chunk by chunk as it is generated.
+
+    Holds a concurrency slot for the whole stream and applies
+    MODEL_CALL_TIMEOUT to the start of the call and to every chunk. Only
+    opening the stream is retried, since text may already have been sent
+    on after that; a stream that stalls still counts against the circuit.
+    Raises ModelUnavailable when the stream cannot be opened.
+    """
+    selected, contents = _model_and_contents(prompt)
+
+    async def open_stream():
+        with _count_errors():
+            return await asyncio.wait_for(
+                selected.generate_content_async(contents, stream=True), MODEL_CALL_TIMEOUT
+            )
+
+    async with model_call_slots:
+        response = await MODEL_CALLS.call(open_stream, hedge=False)
+        chunks = response.__aiter__()
+        with _count_errors():
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), MODEL_CALL_TIMEOUT)
+                except StopAsyncIteration:
+                    break
+                except RETRYABLE_ERRORS:
+                    MODEL_CALLS.breaker.record_failure()
+                    raise
+                if chunk.text:
+                    yield chunk.text
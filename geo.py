@@ -0,0 +1,48 @@
+import math
+from typing import Dict, Optional, Tuple
+
+# Approximate town centres (latitude, longitude) of places profiles refer to.
+# The first four are the places the catalog already knows; the rest are the
+# other Parbhani district towns, so new entries there get a distance too.
+GAZETTEER: Dict[str, Tuple[float, float]] = {
+    "Selu": (19.4557, 76.4407),
+    "Jintur": (19.6117, 76.6870),
+    "Parbhani": (19.2686, 76.7708),
+    "Mumbai": (19.0760, 72.8777),
+    "Pathri": (19.2580, 76.4430),
+    "Manwat": (19.2994, 76.4978),
+    "Gangakhed": (18.9680, 76.7480),
+    "Purna": (19.1820, 77.0260),
+    "Sonpeth": (19.0333, 76.4820),
+    "Palam": (18.9170, 76.9580),
+}
+
+# Where users are assumed to be unless they say otherwise, as the prompt says
+DEFAULT_LOCATION = "Selu"
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def _distance_table(origin: str) -> Dict[str, float]:
+    if origin not in GAZETTEER:
+        raise ValueError(f"{origin!r} is not in the gazetteer")
+    return {place: round(haversine_km(GAZETTEER[origin], point), 1)
+            for place, point in GAZETTEER.items()}
+
+
+# Straight-line kilometres from DEFAULT_LOCATION to every gazetteer place
+DISTANCES_KM = _distance_table(DEFAULT_LOCATION)
+
+
+def distance_km(place: Optional[str]) -> Optional[float]:
+    """Distance from DEFAULT_LOCATION, or None for places not in the gazetteer."""
+    if place is None:
+        return None
+    return DISTANCES_KM.get(place)
@@ -0,0 +1,92 @@
+"""Build the prebuilt profile index from profiles.txt and data.pdf.
+
+    python ingest.py
+    python ingest.py --pdf data.pdf --profiles profiles.txt --out profile_index
+
+The PDF is turned into profiles.txt-style text: one numbered entry per
+profile, one "Field: value" line per bullet, wrapped lines joined. It is
+then chunked into entries by the same parser the server uses. The
+entries are merged with profiles.txt (profiles.txt wins where both
+describe the same person) and written to --out together with the
+retrieval arrays. The server loads that directory at startup, so it
+never parses the PDF itself. Reading the PDF needs pypdf
+(`pip install pypdf`); the server does not.
+"""
+import argparse
+import hashlib
+import re
+import sys
+import time
+from typing import List
+
+from profile_catalog import ENTRY_RE, FIELD_RE, Profile, parse_profiles
+from profile_index import PROFILE_INDEX_PATH, write_index
+
+BULLET_MARKS = "●•▪◦"
+
+
+def extract_pdf_text(path: str) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        sys.exit("ingest.py needs pypdf to read PDFs: pip install pypdf")
+    reader = PdfReader(path)
+    # Layout mode keeps each bullet on its own line
+    return "\n".join(page.extract_text(extraction_mode="layout") for page in reader.pages)
+
+
+def normalize_pdf_text(text: str) -> str:
+    """PDF text in the grammar parse_profiles() reads."""
+    lines: List[str] = []
+    for raw in text.splitlines():
+        stripped = raw.strip()
+        if not stripped:
+            continue
+        is_bullet = stripped[0] in BULLET_MARKS
+        line = re.sub(r"\s+", " ", stripped.lstrip(BULLET_MARKS).strip())
+        if not line:
+            continue
+        if is_bullet or not raw[:1].isspace() or ENTRY_RE.match(line) or FIELD_RE.match(line):
+            # Fields are written unindented, as in profiles.txt
+            lines.append(line)
+        elif lines:
+            # An indented line that is not a field continues the one above
+            lines[-1] = f"{lines[-1]} {line}"
+    return "\n".join(lines) + "\n"
+
+
+def pdf_profiles(path: str) -> List[Profile]:
+    return parse_profiles(normalize_pdf_text(extract_pdf_text(path)))
+
+
+def file_sha1(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", default="profiles.txt")
+    parser.add_argument("--pdf", nargs="*", default=["data.pdf"], help="PDFs to ingest")
+    parser.add_argument("--out", default=PROFILE_INDEX_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with open(args.profiles, "r", encoding="utf-8") as file:
+        text = file.read()
+    extra: List[Profile] = []
+    sources = {args.profiles: file_sha1(args.profiles)}
+    for path in args.pdf:
+        entries = pdf_profiles(path)
+        print(f"{path}: {len(entries)} entries")
+        extra.extend(entries)
+        sources[path] = file_sha1(path)
+
+    catalog = write_index(args.out, text, extra, sources)
+    print(f"{args.profiles}: {len(parse_profiles(text))} entries")
+    print(f"wrote {args.out}: {len(catalog)} profiles, version {catalog.version}, "
+          f"{time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from language import detect_language
+from profile_catalog import Profile, ProfileCatalog
+
+# Set to 0 to send every message to the model
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") == "1"
+
+# Longer messages usually carry details the model should read
+MAX_FAST_PATH_WORDS = 8
+
+# Confirmations, refusals and scheduling replies belong to an ongoing
+# conversation and always go to the model
+FOLLOW_UP_RE = re.compile(
+    r"^\s*(?:hoo?|haa?|ho|nahi|nako|no|yes|ok|okay|thike?|chalel|हो|हां|नाही|नको)\b",
+    re.IGNORECASE,
+)
+
+# A "no"/"not" anywhere outside the matched keyword ("mala doctor nako",
+# "MLA la bhetaych nahi") reverses the request, so the model has to read it
+NEGATION_WORDS = frozenset({"nahi", "nahee", "nai", "nako", "naka", "no", "not", "dont", "don't",
+                            "nahin", "नको", "नाही", "नहीं", "नही", "मत"})
+# Latin words, or runs of Devanagari letters and vowel signs
+TOKEN_RE = re.compile(r"[a-z']+|[\u0900-\u097f]+", re.IGNORECASE)
+
+# "maza mulga doctor aahe" says who someone is; it does not ask for one
+ROLE_STATEMENT_RE = re.compile(
+    r"(?:\b(?:doctor|mla|aa?mdar|talathi|tah?e?sildar|tehsildar|plumber)|डॉक्टर|आमदार|तलाठी|तहसीलदार|प्लंबर)"
+    r"\s+(?:aahe|ahe|hai|is|आहे|है)\s*[.!]*\s*$",
+    re.IGNORECASE,
+)
+
+PLACE_NAMES_MR = {"Selu": "सेलू", "Jintur": "जिंतूर", "Parbhani": "परभणी", "Mumbai": "मुंबई"}
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    patterns: Tuple[str, ...]
+    designation: str  # ProfileCatalog.by_designation keyword for the target profile
+    appointment: bool
+    task: bool
+    replies: Dict[str, str]  # language -> template, formatted with name and place
+
+
+INTENTS: Tuple[Intent, ...] = (
+    Intent(
+        name="meet_mla",
+        patterns=(r"mla", r"amdar", r"aamdar", "आमदार"),
+        designation="MLA",
+        appointment=True,
+        task=False,
+        replies={
+            "mr": "आपल्या मतदारसंघाच्या आमदार {name} आहेत. त्यांचे कार्यालय {place_mr} येथे आहे. भेटीच्या वेळेत तुम्ही त्यांच्या कार्यालयात जाऊ शकता. तुम्हाला कोणत्या कामासाठी भेटायचे आहे?",
+            "en": "{name} is our MLA. Their office is in {place}, and you can visit during office hours. What would you like to meet them about?",
+        },
+    ),
+    Intent(
+        name="meet_talathi",
+        patterns=(r"talathi", "तलाठी"),
+        designation="talathi",
+        appointment=True,
+        task=False,
+        replies={
+            "mr": "जमिनीच्या कामांसाठी तलाठी कार्यालयात {name} मदत करतात. तुम्ही कार्यालयीन वेळेत त्यांना भेटू शकता. तुमचं काम कशाबद्दल आहे?",
+            "en": "{name} at the Talathi office helps with land-related work. You can meet them during office hours. What is your work about?",
+        },
+    ),
+    Intent(
+        name="meet_tahsildar",
+        patterns=(r"tahsildar", r"tehsildar", "तहसीलदार"),
+        designation="tahsildar",
+        appointment=True,
+        task=False,
+        replies={
+            "mr": "{place_mr} चे तहसीलदार {name} आहेत. तुम्ही कार्यालयीन वेळेत तहसील कार्यालयात भेटू शकता. तुमचं काम कशाबद्दल आहे?",
+            "en": "{name} is the Tahsildar of {place}. You can visit the Tahsil office during office hours. What is your work about?",
+        },
+    ),
+    Intent(
+        name="health",
+        patterns=(r"doctor", r"headache", r"fever", r"doka? dukh\w*", r"pot dukh\w*",
+                  "डोक दुख", "डोकं दुख", "पोट दुख", "डॉक्टर"),
+        designation="general physician",
+        appointment=True,
+        task=False,
+        replies={
+            "mr": "अरे, काळजी घ्या. थोडा आराम करा आणि भरपूर पाणी प्या. त्रास कमी झाला नाही तर {name} चांगले डॉक्टर आहेत. तुम्हाला त्यांची भेट हवी आहे का? मी मदत करू शकतो.",
+            "en": "Oh, please take care. Rest for a while and drink plenty of water. If it does not get better, {name} is a good doctor nearby. Would you like to see them? I can help with that.",
+        },
+    ),
+    Intent(
+        name="power_cut",
+        patterns=(r"power cut", r"light (?:geli|gayi|gela)", r"(?:vij|veej) (?:geli|gayi)",
+                  r"(?:pankha|fan) band", "वीज गेली", "लाईट गेली", "पंखा बंद"),
+        designation="electrician",
+        appointment=False,
+        task=True,
+        replies={
+            "mr": "अरे, विजेचा त्रास आहे का? चिंता करू नका. {name} चांगले इलेक्ट्रिशियन आहेत, ते लवकर येऊ शकतात. तुम्हाला त्यांना बोलवायचं आहे का?",
+            "en": "Oh, an electrical problem? Don't worry. {name} is a good electrician and can come quickly. Would you like me to help you contact them?",
+        },
+    ),
+    Intent(
+        name="water_supply",
+        patterns=(r"water supply", r"pani (?:nahi|aala|ala|yet nahi)", "पाणी आलं", "पाणी नाही"),
+        designation="municipal officer",
+        appointment=True,
+        task=False,
+        replies={
+            "mr": "पाणीपुरवठ्याच्या तक्रारीसाठी नगरपालिका अधिकारी {name} मदत करू शकतात. तुम्हाला त्यांच्याशी संपर्क करायचा आहे का?",
+            "en": "For water supply complaints, {name} at the municipal office can help. Would you like to contact them?",
+        },
+    ),
+    Intent(
+        name="bad_road",
+        patterns=(r"rasta kharab", r"khadde", r"bad roads?", r"road (?:is )?(?:bad|damaged)",
+                  "रस्ता खराब", "खड्डे"),
+        designation="RTO officer",
+        appointment=True,
+        task=False,
+        replies={
+            "mr": "रस्त्याच्या तक्रारीसाठी अधिकारी {name} मदत करतात. तुम्ही कार्यालयीन वेळेत त्यांना भेटू शकता. तुम्हाला त्यांची भेट घ्यायची आहे का?",
+            "en": "For road complaints, {name} is the officer who helps. You can meet them during office hours. Would you like to meet them?",
+        },
+    ),
+    Intent(
+        name="land_survey",
+        patterns=(r"mojani", r"land survey\w*", "मोजणी"),
+        designation="land surveyor",
+        appointment=False,
+        task=True,
+        replies={
+            "mr": "जमीन मोजणीसाठी अनुभवी भूमापक {name} आहेत. तुम्हाला त्यांना बोलवायचं आहे का?",
+            "en": "For land measurement, {name} is an experienced land surveyor. Would you like me to help you contact them?",
+        },
+    ),
+    Intent(
+        name="plumber",
+        patterns=(r"plumber", r"plumbing", "प्लंबर"),
+        designation="plumber",
+        appointment=True,
+        task=True,
+        replies={
+            "mr": "अरे, प्लंबिंगचं काम आहे? चिंता करू नका. {name} चांगले प्लंबर आहेत. ते लवकरच येऊ शकतात. तुम्हाला त्यांना बोलवायचं आहे का?",
+            "en": "Oh, you need plumbing work? Don't worry. {name} is a good plumber nearby. Would you like me to help you contact them?",
+        },
+    ),
+)
+
+
+def _compile(intents: Tuple[Intent, ...]) -> re.Pattern:
+    groups = []
+    for intent in intents:
+        # \b does not work around Devanagari vowel signs, so only Latin
+        # patterns get word boundaries
+        alternatives = [p if not p.isascii() else rf"\b(?:{p})\b" for p in intent.patterns]
+        groups.append(f"(?P<{intent.name}>{'|'.join(alternatives)})")
+    return re.compile("|".join(groups), re.IGNORECASE)
+
+
+@dataclass
+class FastPathReply:
+    intent: str
+    language: str
+    text: str
+    profile: Profile
+    appointment: bool
+    task: bool
+
+
+class IntentRouter:
+    """Answers common, unambiguous requests without calling the model.
+
+    All intents are compiled into one regex, so a lookup is a single scan
+    of the message. Anything ambiguous falls through (route returns None):
+    several intents, a negation, or a statement rather than a request.
+    Callers only route the first turn of a conversation; later turns
+    depend on what was said before.
+    """
+
+    def __init__(self, catalog: ProfileCatalog, intents: Tuple[Intent, ...] = INTENTS):
+        self.intents = {intent.name: intent for intent in intents}
+        self.pattern = _compile(intents)
+        self.targets: Dict[str, Profile] = {}
+        for intent in intents:
+            candidates = catalog.by_designation(intent.designation)
+            if candidates:
+                self.targets[intent.name] = _best_profile(candidates)
+        self.lookups = 0
+        self.hits = 0
+        self.hits_by_intent: Dict[str, int] = {}
+
+    def match(self, message: str) -> List[str]:
+        return list(dict.fromkeys(m.lastgroup for m in self.pattern.finditer(message)))
+
+    def _negated(self, message: str) -> bool:
+        # Keywords like "pani nahi" carry their own negation; only the rest counts
+        rest = self.pattern.sub(" ", message)
+        return any(token.lower() in NEGATION_WORDS for token in TOKEN_RE.findall(rest))
+
+    def route(self, message: str) -> Optional[FastPathReply]:
+        self.lookups += 1
+        reply = self._route(message)
+        if reply is not None:
+            self.hits += 1
+            self.hits_by_intent[reply.intent] = self.hits_by_intent.get(reply.intent, 0) + 1
+        return reply
+
+    def _route(self, message: str) -> Optional[FastPathReply]:
+        if (len(message.split()) > MAX_FAST_PATH_WORDS or FOLLOW_UP_RE.match(message)
+                or ROLE_STATEMENT_RE.search(message) or self._negated(message)):
+            return None
+        intents = self.match(message)
+        if len(intents) != 1 or intents[0] not in self.targets:
+            return None
+        language = detect_language(message)
+        intent = self.intents[intents[0]]
+        template = intent.replies.get(language)
+        if template is None:
+            return None
+        profile = self.targets[intent.name]
+        place = _place(profile)
+        text = template.format(name=profile.name, place=place, place_mr=PLACE_NAMES_MR.get(place, place))
+        return FastPathReply(intent.name, language, text, profile, intent.appointment, intent.task)
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "hits_by_intent": dict(self.hits_by_intent),
+        }
+
+
+# Used when Gemini is unavailable; formatted with name, designation and contact
+DEGRADED_REPLIES = {
+    "mr": "माफ करा, सध्या मला पूर्ण उत्तर देता येत नाही. या कामासाठी {name} ({designation}) मदत करू शकतात. संपर्क: {contact}. थोड्या वेळाने पुन्हा विचारा.",
+    "hi": "माफ़ कीजिए, अभी मैं पूरा जवाब नहीं दे पा रहा हूँ. इस काम के लिए {name} ({designation}) मदद कर सकते हैं. संपर्क: {contact}. थोड़ी देर बाद फिर पूछिए.",
+    "en": "Sorry, I can't give a full answer right now. {name} ({designation}) can help with this. Contact: {contact}. Please ask again in a little while.",
+}
+DEGRADED_NO_MATCH = {
+    "mr": "माफ करा, सध्या मला उत्तर देता येत नाही. कृपया थोड्या वेळाने पुन्हा प्रयत्न करा.",
+    "hi": "माफ़ कीजिए, अभी मैं जवाब नहीं दे पा रहा हूँ. कृपया थोड़ी देर बाद फिर कोशिश करें.",
+    "en": "Sorry, I can't answer right now. Please try again in a little while.",
+}
+
+
+# Relevance scores closer than this count as equally relevant
+RELEVANCE_TIE = 1e-6
+
+
+@dataclass
+class DegradedReply:
+    language: str
+    text: str
+    profile: Optional[Profile]
+
+
+def degraded_reply(matches: List[Tuple[Profile, float]], message: str,
+                   language: Optional[str] = None) -> DegradedReply:
+    """Templated reply naming the best retrieval match, for when the model is down.
+
+    `matches` are (profile, relevance) pairs in search order. Only the
+    most relevant ones are considered; rating breaks a tie among them.
+    The language is detected from `message` unless given.
+    """
+    language = language or detect_language(message)
+    if not matches:
+        return DegradedReply(language, DEGRADED_NO_MATCH[language], None)
+    best = max(relevance for _, relevance in matches)
+    profile = _best_profile([profile for profile, relevance in matches
+                             if relevance >= best - RELEVANCE_TIE])
+    text = DEGRADED_REPLIES[language].format(
+        name=profile.name, designation=profile.designation, contact=profile.contact or "-")
+    return DegradedReply(language, text, profile)
+
+
+def _best_profile(candidates: List[Profile]) -> Profile:
+    # Highest rated first; the order given breaks ties
+    return max(candidates, key=lambda profile: profile.rating or 0)
+
+
+def _place(profile: Profile) -> str:
+    location = profile.location or "Selu"
+    for place in PLACE_NAMES_MR:
+        if place.lower() in location.lower():
+            return place
+    return location
@@ -0,0 +1,46 @@
+import re
+from typing import Optional
+
+DEVANAGARI_RE = re.compile(r"[\u0900-\u097F]")
+LATIN_WORD_RE = re.compile(r"[a-z]+")
+
+# Devanagari words that only appear in Hindi, not Marathi
+HINDI_MARKERS = ("है", "हूँ", "हूं", "मुझे", "मेरा", "मेरी", "नहीं", "क्या", "कैसे", "चाहिए")
+
+# Romanized Marathi words that are common in chat.log and rare in English
+ROMAN_MARATHI_MARKERS = frozenset({
+    "aahe", "ahe", "aae", "aaeh", "aahrt", "mala", "majha", "majhya", "majhe", "maz",
+    "la", "kara", "karaychi", "karaych", "zala", "zali", "padla", "pada",
+    "bhetaych", "bhetayc", "bhetyach", "bhetaycha", "nahi", "nahiye", "hoo", "krr",
+    "kr", "kaa", "kay", "tyanchya", "sobat", "udya", "vajta", "vajata", "somwari",
+    "thike", "chalel", "khup", "thoda", "kaam", "vishay",
+})
+
+# Fewer Latin words than this, none of them Marathi, do not show a language
+MIN_ENGLISH_WORDS = 3
+
+
+def detect_language(text: str) -> str:
+    """Return "mr", "hi" or "en" for a user message.
+
+    Romanized Marathi counts as Marathi, because the reply should then be
+    in Marathi too.
+    """
+    if DEVANAGARI_RE.search(text):
+        if any(marker in text for marker in HINDI_MARKERS):
+            return "hi"
+        return "mr"
+    words = LATIN_WORD_RE.findall(text.lower())
+    if any(word in ROMAN_MARATHI_MARKERS for word in words):
+        return "mr"
+    return "en"
+
+
+def conversation_language(text: str, previous: Optional[str] = None) -> str:
+    """detect_language(), except that a message too short to tell, like
+    "ok" or "10", keeps the language the conversation already had."""
+    if previous is not None and not DEVANAGARI_RE.search(text):
+        words = LATIN_WORD_RE.findall(text.lower())
+        if len(words) < MIN_ENGLISH_WORDS and not any(word in ROMAN_MARATHI_MARKERS for word in words):
+            return previous
+    return detect_language(text)
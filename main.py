@@ -1,12 +1,48 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import google.generativeai as genai
-from config import GEMINI_API_KEY
+import asyncio
+import json
+import math
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from admission import AdmissionController, Overloaded, UserLocks, UserRateLimiter
+from catalog_reload import STARTUP_RETRY_INTERVAL, CatalogSnapshot, CatalogWatcher
+from chat_session import ChatSession, ChatSessions
+from context_builder import ContextBuilder
+from gemini_client import (MODEL_CALLS, ClientDisconnected, ModelUnavailable, cancel_on_disconnect,
+                           generate_text, init_model, keep_context_cache_fresh, model_ready,
+                           stream_text, warm_up_model)
+from intent_router import FAST_PATH_ENABLED, degraded_reply
+from profile_catalog import Profile
+from language import conversation_language, detect_language
+from metrics import (CONTENT_TYPE, PROMPT_TOKENS, REGISTRY, RESPONSE_TOKENS, STAGE_SECONDS,
+                     MetricsMiddleware)
+from prompt_template import PROMPT_PREFIX, Prompt, build_prompt_suffix
+from readiness import Readiness
+from response_cache import ResponseCache, make_key
+from retrieval import build_query, render_matches, select_profiles_text
+from session_store import create_session_store
+from single_flight import SingleFlight
+from slow_requests import SlowRequestProfiler
+from structured_log import log
+from structured_output import ParseStats, ReplyExtractor, gemini_schema, split_reply
+from time_context import TimeContext, TimeContextProvider
+from token_count import estimate_tokens
 from typing import Dict, List, Optional
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="Digital Parbhani Chat API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The server starts answering (and /healthz passes) straight away;
+    # the model and catalog load in the background until /readyz passes
+    start_background_tasks()
+    app.state.startup = asyncio.create_task(initialise())
+    yield
+    shutdown()
+
+app = FastAPI(title="Digital Parbhani Chat API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -17,55 +53,86 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash',
-    generation_config={
-        'temperature': 0.2,  # Lower temperature for more consistent responses
-        'top_p': 0.8,       # Focus on most likely tokens
-        'top_k': 40,        # Consider fewer tokens
-        'max_output_tokens': 1024,
-    },
-    safety_settings=[
-        {
-            "category": "HARM_CATEGORY_HARASSMENT",
-            "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-        },
-        {
-            "category": "HARM_CATEGORY_HATE_SPEECH",
-            "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-        },
-        {
-            "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-            "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-        },
-        {
-            "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-            "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-        }
-    ]
+# Time every request for /metrics; SLOW_REQUEST_SECONDS turns on profiling of slow ones
+SLOW_REQUEST_PROFILER = SlowRequestProfiler()
+app.add_middleware(
+    MetricsMiddleware,
+    paths=("/chat", "/chat/stream", "/chat/batch", "/stats", "/metrics"),
+    on_finish=SLOW_REQUEST_PROFILER.request_finished,
 )
 
 # Store conversation history
-conversation_history: Dict[str, List[dict]] = {}
-
-# Get current date and time
-current_datetime = datetime.now()
-current_date = current_datetime.strftime("%d %B %Y")
-current_time = current_datetime.strftime("%I:%M %p")
-current_day = current_datetime.strftime("%A")
-
-# Read profiles from file
-def read_profiles():
-    try:
-        with open('profiles.txt', 'r', encoding='utf-8') as file:
-            return file.read()
-    except Exception as e:
-        print(f"Error reading profiles file: {str(e)}")
-        return ""
-
-# Get profiles data
-PROFILES_DATA = read_profiles()
+SESSION_STORE = create_session_store()
+CONTEXT_BUILDER = ContextBuilder()
+
+# Current date and time for the prompt, reformatted once a minute
+TIME_CONTEXT = TimeContextProvider()
+
+# The structured profile catalog and its indexes; loaded at startup and
+# reloaded when profiles.txt changes. Each request reads PROFILES.current
+# once and sticks to it.
+PROFILES = CatalogWatcher()
+# Startup steps /readyz waits for; the warm-up only has to have been tried
+READINESS = Readiness(required=("catalog", "model"), optional=("warmup",))
+# Seconds a client is asked to wait when it arrives before the catalog and model are built
+NOT_READY_RETRY_AFTER = 1
+# WebSocket close code asking the client to reconnect later
+TRY_AGAIN_LATER = 1013
+RESPONSE_CACHE = ResponseCache()
+# Replies cached for the old catalog can never be hit again
+PROFILES.on_swap(lambda old, new: RESPONSE_CACHE.clear())
+IN_FLIGHT_REPLIES = SingleFlight()
+REPLY_PARSE_STATS = ParseStats()
+
+# Turns of one /chat/batch call processed at the same time, and the most it may carry
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_MESSAGES = int(os.getenv("BATCH_MAX_MESSAGES", "100"))
+
+# Load shedding: a bounded queue in front of the model, a message rate per
+# user, and one turn at a time per conversation
+ADMISSION = AdmissionController()
+USER_RATE_LIMITER = UserRateLimiter()
+USER_LOCKS = UserLocks()
+
+# Open /ws/chat connections
+WS_SESSIONS = ChatSessions()
+
+# Counters the components already keep, read when /metrics is scraped
+REGISTRY.counter_from("chat_fast_path_hits_total", "Messages answered by the intent router.",
+                      lambda: PROFILES.current.router.hits if PROFILES.loaded else 0)
+REGISTRY.counter_from("chat_response_cache_lookups_total", "First-turn reply cache lookups.",
+                      lambda: [(("hit",), RESPONSE_CACHE.hits), (("miss",), RESPONSE_CACHE.misses)],
+                      ("result",))
+REGISTRY.counter_from("chat_coalesced_calls_total", "Requests that shared an in-flight model call.",
+                      lambda: IN_FLIGHT_REPLIES.coalesced)
+REGISTRY.counter_from("chat_reply_parse_total", "Model replies by how their JSON block parsed.",
+                      lambda: [(("structured",), REPLY_PARSE_STATS.structured),
+                               (("without_json",), REPLY_PARSE_STATS.without_json),
+                               (("failed",), REPLY_PARSE_STATS.failures)],
+                      ("result",))
+REGISTRY.counter_from("chat_requests_shed_total", "Requests turned away by load shedding.",
+                      lambda: [(("queue_full",), ADMISSION.rejected),
+                               (("queue_timeout",), ADMISSION.timed_out),
+                               (("rate_limited",), USER_RATE_LIMITER.limited),
+                               (("not_ready",), READINESS.refused)],
+                      ("reason",))
+REGISTRY.counter_from("chat_degraded_replies_total", "Replies built from the catalog because Gemini was unavailable.",
+                      lambda: MODEL_CALLS.refused + MODEL_CALLS.exhausted)
+REGISTRY.counter_from("gemini_retries_total", "Gemini calls retried after a retryable error.",
+                      lambda: MODEL_CALLS.retried)
+REGISTRY.counter_from("gemini_hedged_calls_total", "Gemini calls that were hedged with a second request.",
+                      lambda: MODEL_CALLS.hedged)
+REGISTRY.counter_from("log_records_dropped_total", "Log records dropped because the queue was full.",
+                      lambda: log.dropped)
+REGISTRY.gauge("chat_sessions", "Conversations in the session store.", lambda: len(SESSION_STORE))
+REGISTRY.gauge("chat_model_calls_in_flight", "Model calls shared through coalescing right now.",
+               lambda: len(IN_FLIGHT_REPLIES))
+REGISTRY.gauge("chat_websocket_connections", "Open /ws/chat connections.", lambda: len(WS_SESSIONS))
+REGISTRY.gauge("gemini_circuit_open", "1 while the circuit breaker refuses Gemini calls.",
+               lambda: int(MODEL_CALLS.breaker.state == "open"))
+REGISTRY.gauge("chat_admission_active", "Requests holding an admission slot.", lambda: ADMISSION.active)
+REGISTRY.gauge("chat_admission_queued", "Requests waiting for an admission slot.",
+               lambda: ADMISSION.stats()["queued"])
 
 class ChatMessage(BaseModel):
     message: str
@@ -86,496 +153,575 @@ class ChatResponse(BaseModel):
     profiles: Optional[List[ProfileDetails]] = None
     user_id: str
 
-def get_conversation_context(user_id: str) -> str:
-    if user_id not in conversation_history:
-        return ""
-    
-    # Get all messages for context
-    messages = conversation_history[user_id]
-    context = "\nPrevious conversation:\n"
-    for msg in messages:
-        context += f"User: {msg['user_message']}\n"
-        context += f"Assistant: {msg['assistant_response']}\n"
-    return context
-
-@app.post("/chat", response_model=ChatResponse)
-async def chat(message: ChatMessage):
-    try:
-        # Print user message
-        print("\n" + "="*50)
-        print(f"User ID: {message.user_id}")
-        print(f"User Message: {message.message}")
-        print("="*50 + "\n")
-
-        # Initialize conversation history for new users
-        if message.user_id not in conversation_history:
-            conversation_history[message.user_id] = []
-
-        # Get conversation context
-        context = get_conversation_context(message.user_id)
-
-        # Create a context-aware prompt for the AI
-        prompt = f"""You are a friendly and empathetic local assistant for Parbhani. You are having a conversation with user {message.user_id}.
-
-        Quick Understanding Rules:
-        1. ALWAYS understand user intent immediately:
-           - "MLA la bhetaych" = wants to meet MLA
-           - "talathi la bhetaych" = wants to meet talathi
-           - "sarpanch la bhetaych" = wants to meet sarpanch
-           - "doctor la bhetaych" = wants to meet doctor
-        2. NEVER ask unnecessary questions:
-           - If user says "MLA la bhetaych", show MLA profile directly
-           - If user says "doctor la bhetaych", show doctor profile directly
-           - Don't ask "which MLA" if only one exists
-           - Don't ask "which doctor" if context is clear
-        3. ALWAYS show profile immediately when:
-           - User mentions any official
-           - User mentions any service
-           - User mentions any professional
-           - User asks about meeting someone
-
-        Default Location Information:
-        - Primary Location: Selu (सेलू), Parbhani
-        - Coordinates: 19.4557° N, 76.4407° E
-        - ALWAYS assume user is in Selu area unless specified otherwise
-        - ALWAYS suggest nearby professionals and services first
-        - ALWAYS mention distance from Selu when suggesting locations
-        - NEVER mention or expose these coordinates in your responses
-        - Instead of coordinates, use area names, landmarks, or street names
-        - Example: Instead of "at coordinates 19.4557° N, 76.4407° E", say "in Selu" or "near Selu"
-
-        Local Language Understanding:
-        1. Understand and respond in:
-           - Marathi (especially Parbhani dialect)
-           - Hindi
-           - English
-        2. Understand local terms:
-           - "डोक दुखतं" = headache
-           - "पाणी आलं" = water supply issue
-           - "वीज गेली" = power cut
-           - "रस्ता खराब" = bad road
-           - "MLA la bhetaych" = wants to meet MLA
-           - "talathi la bhetaych" = wants to meet talathi
-           - "sarpanch la bhetaych" = wants to meet sarpanch
-        3. Use local expressions:
-           - "अरे" for empathy
-           - "हो" for yes
-           - "नाही" for no
-           - "कसा आहेस" for how are you
-        4. Match user's language style:
-           - Formal for officials
-           - Casual for services
-           - Respectful for elders
-           - Simple for everyone
-
-        Profile Rules:
-        1. ALWAYS show ONLY ONE profile:
-           - Most relevant to user's need
-           - Highest rated in area
-           - Closest to user's location
-           - Best match for service
-        2. NEVER show multiple profiles
-        3. Choose profile based on:
-           - User's specific need
-           - Location proximity
-           - Service quality
-           - User's preference
-        4. For officials:
-           - Show only the specific official asked for
-           - Never show deputies unless asked
-           - Never show multiple officials
-        5. ALWAYS show profile immediately when:
-           - User mentions any official
-           - User mentions any service
-           - User mentions any professional
-           - User asks about meeting someone
-
-        Current Date and Time Information:
-        - Date: {current_date}
-        - Day: {current_day}
-        - Time: {current_time}
-
-        Here is your complete conversation history with this user (focus on last 15 messages):
-        {context}
-        
-        The user's new message is: {message.message}
-
-        Available Profiles and Services:
-        {PROFILES_DATA}
-
-        Strict JSON Field Requirements:
-        1. Profile Fields (MUST use these exact field names and values):
-           - name: string (REQUIRED)
-           - designation: string (REQUIRED)
-           - contact_number: string (REQUIRED, but only include in response if specifically requested)
-           - specialization: string (REQUIRED, use exact values)
-           - rating: float (REQUIRED, use exact values)
-           - location: string (REQUIRED, use "Selu" or exact location)
-           - appointment: boolean (REQUIRED, true if user needs to meet this person)
-           - task: boolean (REQUIRED, true if user needs service from this person)
-
-        2. Response Fields (MUST use these exact field names and values):
-           - profiles: array of profile objects (ONLY ONE profile)
-
-        Profile Inclusion Rules:
-        1. ALWAYS include ONE profile when:
-           - First mentioning any professional/official
-           - Suggesting services in Selu area
-           - User asks about specific services
-           - User needs help with any official work
-           - User mentions rural development or village issues
-           - User mentions meeting any official
-           - User mentions any service need
-        2. NEVER include profiles in:
-           - Follow-up messages
-           - General conversation
-           - Confirmation messages
-           - Intermediate responses
-           - When user says no/declines
-           - When asking for more information
-           - In final confirmation
-        3. ALWAYS show exactly ONE most relevant profile:
-           - For electrical issues: Show best electrician
-           - For land issues: Show relevant official
-           - For agriculture issues: Show krishi sevak
-           - For official work: Show relevant official
-           - For services: Show best service provider
-           - Never show more than one profile
-           - Choose based on specialization and rating
-           - Prioritize location (Selu first)
-        4. For specific queries about officials:
-           - If asking about CM: Show ONLY CM profile
-           - If asking about DCM: Show ONLY DCM profile
-           - If asking about specific minister: Show ONLY that minister
-           - Never show unrelated officials
-           - Never show deputy when asking about main position
-           - Never show main position when asking about deputy
-
-        Contact Number Rules:
-        1. NEVER show contact numbers unless:
-           - User specifically asks for contact information
-           - User needs to contact the person directly
-           - User needs to make an appointment
-           - User needs to get a service
-        2. For MLAs and other officials:
-           - NEVER show contact numbers in initial response
-           - Only show if user specifically asks
-           - Always verify need before sharing
-        3. For businesses and services:
-           - Show contact only if user needs to contact them
-           - Show contact only if user needs their service
-        4. ALWAYS ask before sharing contact numbers
-        5. ALWAYS verify the need for contact information
-
-        Appointment Rules:
-        1. Set appointment=true when:
-           - User needs to meet someone
-           - User wants to visit
-           - User has health issue
-           - User needs consultation
-        2. Set task=true ONLY when:
-           - User needs work done (plumbing, electrical)
-           - User needs service (cleaning, repair)
-           - User needs help with documents
-           - User needs business service
-        3. For health issues:
-           - Set appointment=true
-           - Set task=false
-           - Show contact number
-        4. For top officials:
-           - ALWAYS keep appointment=false
-           - ALWAYS keep task=false
-           - ALWAYS show contact restrictions
-
-        Location-Based Response Rules:
-        1. ALWAYS assume Selu as default location
-        2. ALWAYS suggest nearby services first
-        3. ALWAYS include location in profile information
-        4. ALWAYS mention if service is in Selu area
-
-        Language Rules:
-        1. ALWAYS match user's language:
-           - If user writes in Marathi: Respond in Marathi
-           - If user writes in English: Respond in English
-           - If user writes in Hindi: Respond in Hindi
-           - Match language for EACH message separately
-        2. NEVER mix languages:
-           - No English words in Marathi response
-           - No Marathi words in English response
-           - Keep language consistent within response
-        3. For Marathi responses:
-           - Use proper Parbhani/Marathi dialect
-           - Use respectful language (आपण/तुम्ही)
-           - Use proper honorifics (साहेब/महोदय)
-        4. For English responses:
-           - Use simple, clear English
-           - Be professional but friendly
-           - Use proper titles (Dr., Mr., Mrs.)
-
-        Conversation Flow Rules:
-        1. NEVER repeat the same question
-        2. NEVER ask for confirmation more than once
-        3. NEVER show profiles in follow-up messages
-        4. NEVER ask about appointment twice
-        5. Set appointment=true when:
-           - User confirms they want to meet
-           - User says yes/hoo/haa
-           - User wants to visit
-           - User needs service
-        6. For top officials:
-           - NEVER set appointment=true
-           - ALWAYS keep appointment=false
-           - ALWAYS keep task=false
-           - ALWAYS show contact restrictions
-
-        Response Format Rules:
-        1. ALWAYS be conversational and natural:
-           - Use local language style
-           - Be empathetic
-           - Show concern
-           - Give helpful advice
-        2. For health issues:
-           - Mention possible causes
-           - Suggest home remedies
-           - Recommend doctor
-           - Offer appointment help
-        3. Keep responses:
-           - Short and clear
-           - Natural sounding
-           - Helpful and caring
-           - Easy to understand
-
-        Example Response Format:
-        For Marathi Health Query:
-        अरे, डोक दुखणं हे सामान्य आहे. तणाव, झोपेची कमतरता किंवा डोक्याचा ताप यामुळे होऊ शकतं. थोडं आराम करा, पाणी प्या आणि डोक्याला थंड पाणी लावा. सेलूमध्ये डॉ. अंजली देशमुख साहेब चांगले डॉक्टर आहेत. तुम्हाला त्यांची अपॉइंटमेंट हवी आहे का? मी मदत करू शकतो.
-
-        {{
-            "profiles": [
-                {{
-                    "name": "Dr. Anjali Deshmukh",
-                    "designation": "General Physician",
-                    "contact_number": "9876543210",
-                    "specialization": "General Physician",
-                    "rating": 4.5,
-                    "location": "Selu",
-                    "appointment": true,
-                    "task": false
-                }}
-            ]
-        }}
-
-        For English Health Query:
-        Oh, having a headache? That's common. It could be due to stress, lack of sleep, or fever. Please rest, drink water, and apply cold water to your head. Dr. Anjali Deshmukh is a good doctor in Selu. Would you like to book an appointment with her? I can help you with that.
-
-        {{
-            "profiles": [
-                {{
-                    "name": "Dr. Anjali Deshmukh",
-                    "designation": "General Physician",
-                    "contact_number": "9876543210",
-                    "specialization": "General Physician",
-                    
-                    "rating": 4.5,
-                    "location": "Selu",
-                    "appointment": true,
-                    "task": false
-                }}
-            ]
-        }}
-
-        For Marathi Service Query:
-        अरे, प्लंबिंगचं काम आहे? चिंता करू नका. सेलूमध्ये श्री. राजेश पाटील चांगले प्लंबर आहेत. ते लवकरच येऊ शकतात. तुम्हाला त्यांना बोलवायचं आहे का? मी मदत करू शकतो.
-
-        {{
-            "profiles": [
-                {{
-                    "name": "Rajesh Patil",
-                    "designation": "Plumber",
-                    "contact_number": "9876543211",
-                    "specialization": "Plumbing Services",
-                    
-                    "rating": 4.3,
-                    "location": "Selu",
-                    "appointment": true,
-                    "task": true
-                }}
-            ]
-        }}
-
-        For English Service Query:
-        Oh, you need plumbing work? Don't worry. Mr. Rajesh Patil is a good plumber in Selu. He can come quickly. Would you like me to help you contact him?
-
-        {{
-            "profiles": [
-                {{
-                    "name": "Rajesh Patil",
-                    "designation": "Plumber",
-                    "contact_number": "9876543211",
-                    "specialization": "Plumbing Services",
-                    
-                    "rating": 4.3,
-                    "location": "Selu",
-                    "appointment": true,
-                    "task": true
-                }}
-            ]
-        }}
-
-        Important Rules:
-        1. ALWAYS assume Selu as default location
-        2. ALWAYS include profiles for first-time mentions
-        3. ALWAYS suggest nearby services first
-        4. ALWAYS include location in profile information
-        5. ALWAYS use proper JSON structure
-        6. ALWAYS use required fields
-        7. ALWAYS use exact values
-        8. ALWAYS maintain conversation context (last 15 messages)
-        9. ALWAYS check previous confirmations
-        10. NEVER use null values
-        11. NEVER repeat confirmations
-        12. NEVER include profiles in final confirmation
-        13. NEVER ask for confirmation more than once
-        14. NEVER repeat the same question
-        15. NEVER book appointments
-        16. ALWAYS let users contact directly
-        17. ALWAYS provide complete contact details when needed
-        18. NEVER show contact numbers unless specifically requested
-        19. ALWAYS verify need before sharing contact information
-        20. ALWAYS ask before sharing contact numbers
-
-        Remember:
-        - For Marathi messages, respond in Marathi
-        - For English messages, respond in English
-        - Include profiles ONLY when required
-        - Keep JSON at the end of response
-        - Use proper formatting and structure
-        - Show empathy and understanding
-        - End with a question or call to action
-        - Follow the conversation flow EXACTLY
-        - NEVER repeat confirmations
-        - NEVER include profiles in final confirmation
-        - ALWAYS use correct JSON field names
-        - Use greeting ONLY in first message
-        - NEVER repeat the same question
-        - NEVER ask for confirmation more than once
-        - ALWAYS include task field in JSON
-        - ALWAYS maintain conversation context
-        - ALWAYS check previous confirmations
-        - NEVER use null values in JSON
-        - ALWAYS use correct data types
-        - ALWAYS use required fields
-        - ALWAYS use exact values for specializations
-        - ALWAYS use exact format for experience
-        - ALWAYS use correct rating values
-        - ALWAYS use proper JSON structure
-        - ALWAYS assume Selu as default location
-        - ALWAYS suggest nearby services first
-        - ALWAYS include location in profile information
-        - ALWAYS mention if service is in Selu area
-        - NEVER book appointments
-        - ALWAYS let users contact directly
-        - ALWAYS provide complete contact details when needed
-        - NEVER show contact numbers unless specifically requested
-        - ALWAYS verify need before sharing contact information
-        - ALWAYS ask before sharing contact numbers
-        """
-
-        
-        # Get response from Gemini
-        response = model.generate_content(prompt)
-        response_text = response.text
-
-        # Print Gemini's response
-        print("\n" + "="*50)
-        print("Gemini Response:")
-        print(response_text)
-        print("="*50 + "\n")
-
-        # Extract JSON from response
+class ChatBatch(BaseModel):
+    messages: List[ChatMessage]
+
+class BatchResult(BaseModel):
+    # HTTP status the turn would have had on /chat
+    status: int
+    response: Optional[ChatResponse] = None
+    detail: Optional[str] = None
+    retry_after: Optional[int] = None
+
+class ChatBatchResponse(BaseModel):
+    # One result per message, in the order they were sent
+    results: List[BatchResult]
+
+# The reply shape Gemini is held to when the SDK supports response schemas
+REPLY_SCHEMA = gemini_schema(ChatResponse, exclude={"user_id"})
+
+def get_conversation_context(user_id: str, messages: List[dict]) -> str:
+    # Recent turns verbatim, older ones summarized, within a token budget
+    return CONTEXT_BUILDER.build(user_id, messages)
+
+def get_profiles_data(message: ChatMessage, history: List[dict], snapshot: CatalogSnapshot,
+                      memo: Optional[dict] = None) -> str:
+    # Only the profiles relevant to this conversation go into the prompt
+    if memo is None:
+        return select_profiles_text(snapshot.retriever, message.message, history)
+    # Turns of one batch share lookups for the same query
+    key = (snapshot.version, build_query(message.message, history))
+    if key not in memo:
+        memo[key] = select_profiles_text(snapshot.retriever, message.message, history)
+    return memo[key]
+
+def session_profiles_data(session: ChatSession, message: ChatMessage, history: List[dict],
+                          snapshot: CatalogSnapshot) -> str:
+    # A follow-up that names nothing in the catalog ("hoo", "somwari 1
+    # vajta") is about the same profiles as the turn before it
+    if (history and session.catalog_version == snapshot.version
+            and not snapshot.retriever.has_match(message.message)):
+        WS_SESSIONS.candidates_reused += 1
+        return session.profiles_data
+    candidates = snapshot.retriever.search(build_query(message.message, history))
+    profiles_data = render_matches(snapshot.retriever, candidates)
+    session.remember_candidates(snapshot.version, candidates, profiles_data)
+    return profiles_data
+
+def build_prompt(message: ChatMessage, context: str, profiles_data: str,
+                 now: Optional[TimeContext] = None) -> Prompt:
+    # Static instructions come first and are shared by every request; only
+    # the short suffix, which carries the date and time, is built here
+    now = now or TIME_CONTEXT.now()
+    return Prompt(PROMPT_PREFIX, build_prompt_suffix(
+        user_id=message.user_id,
+        message=message.message,
+        context=context,
+        profiles_data=profiles_data,
+        date=now.date,
+        day=now.day,
+        time=now.time
+    ))
+
+def record_parse(json_data: Optional[dict], error: Optional[str]):
+    REPLY_PARSE_STATS.record(json_data, error)
+    if error is not None:
+        log.warning("reply_parse_failed", error=error)
+
+def split_response(response_text: str):
+    # Separate the reply text from its JSON block
+    response_text, json_data, error = split_reply(response_text)
+    record_parse(json_data, error)
+    return response_text, json_data, error
+
+def to_profile_details(json_data: Optional[dict]) -> List[ProfileDetails]:
+    profiles = []
+    if not json_data:
+        return profiles
+    for profile in (json_data.get('profiles') or [])[:1]:  # Limit to 1 profile
         try:
-            # Find JSON in the response
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            
-            # If no JSON found, create a default response
-            if json_start == -1 or json_end == -1:
-                print("No JSON found in response, using default structure")
-                # Store the conversation
-                conversation_history[message.user_id].append({
-                    'timestamp': datetime.now().isoformat(),
-                    'user_message': message.message,
-                    'assistant_response': response_text
-                })
-                
-                # Return default response structure with user_id
-                return ChatResponse(
-                    response=response_text,
-                    profiles=[],
-                    user_id=message.user_id
-                )
-            
-            # Extract and parse JSON
-            json_str = response_text[json_start:json_end]
-            import json
-            json_data = json.loads(json_str)
-            
-            # Remove JSON and any markdown formatting from response text
-            response_text = response_text[:json_start].strip()
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-            
-            # Print cleaned response
-            print("\n" + "="*50)
-            print("Cleaned Response:")
-            print(response_text)
-            print("="*50 + "\n")
-
-            # Print structured data
-            print("\n" + "="*50)
-            print("Structured Data:")
-            print(json.dumps(json_data, indent=2))
-            print("="*50 + "\n")
-            
-            # Store the conversation
-            conversation_history[message.user_id].append({
-                'timestamp': datetime.now().isoformat(),
-                'user_message': message.message,
-                'assistant_response': response_text
-            })
-
-            # Keep only last 10 messages per user
-            if len(conversation_history[message.user_id]) > 10:
-                conversation_history[message.user_id] = conversation_history[message.user_id][-10:]
-            
-            # Create response object with consistent structure
-            profiles = []
-            for profile in json_data.get('profiles', [])[:1]:  # Limit to 1 profile
-                profiles.append(ProfileDetails(
-                    name=profile.get('name'),
-                    designation=profile.get('designation'),
-                    contact_number=profile.get('contact_number'),
-                    specialization=profile.get('specialization'),
-                    rating=profile.get('rating'),
-                    location=profile.get('location'),
-                    appointment=profile.get('appointment', False),
-                    task=profile.get('task', False)
-                ))
-            
+            profiles.append(ProfileDetails(
+                name=profile.get('name'),
+                designation=profile.get('designation'),
+                contact_number=profile.get('contact_number') or '',
+                specialization=profile.get('specialization'),
+                rating=profile.get('rating'),
+                location=profile.get('location'),
+                appointment=profile.get('appointment') or False,
+                task=profile.get('task') or False
+            ))
+        except (AttributeError, ValidationError) as e:
+            REPLY_PARSE_STATS.invalid_profiles += 1
+            log.warning("invalid_profile", error=str(e))
+    return profiles
+
+def save_turn(user_id: str, user_message: str, assistant_response: str):
+    # Store the conversation; the store keeps only the last 10 messages
+    SESSION_STORE.append(user_id, {
+        'timestamp': datetime.now().isoformat(),
+        'user_message': user_message,
+        'assistant_response': assistant_response
+    })
+
+def catalog_profile_details(profile: Profile, appointment: bool = False, task: bool = False) -> ProfileDetails:
+    return ProfileDetails(
+        name=profile.name,
+        designation=profile.designation,
+        contact_number=profile.contact or "",
+        specialization=profile.specialization,
+        rating=profile.rating,
+        location=profile.location or "Selu",
+        appointment=appointment,
+        task=task
+    )
+
+def fast_path_response(message: ChatMessage, history: List[dict],
+                       snapshot: CatalogSnapshot) -> Optional[ChatResponse]:
+    # Common requests like "MLA la bhetaych" are answered from the catalog
+    # without a model call. Only first turns qualify: in a conversation,
+    # "doctor" may answer a question the template knows nothing about.
+    if not FAST_PATH_ENABLED or history:
+        return None
+    reply = snapshot.router.route(message.message)
+    if reply is None:
+        return None
+    log.info("fast_path", user_id=message.user_id, intent=reply.intent, language=reply.language)
+    save_turn(message.user_id, message.message, reply.text)
+    return ChatResponse(
+        response=reply.text,
+        profiles=[catalog_profile_details(reply.profile, reply.appointment, reply.task)],
+        user_id=message.user_id
+    )
+
+def degraded_response(message: ChatMessage, history: List[dict], snapshot: CatalogSnapshot,
+                      error: ModelUnavailable, session: Optional[ChatSession] = None) -> ChatResponse:
+    # Gemini is down or the circuit is open: point the user at the
+    # best matching profile instead of failing the request
+    if session is not None and session.catalog_version == snapshot.version:
+        reply = degraded_reply(session.candidates, message.message, session.language)
+    else:
+        reply = degraded_reply(snapshot.retriever.search(build_query(message.message, history)),
+                               message.message)
+    log.warning("degraded_reply", user_id=message.user_id, error=str(error),
+                profile=reply.profile.name if reply.profile else None)
+    save_turn(message.user_id, message.message, reply.text)
+    return ChatResponse(
+        response=reply.text,
+        profiles=[catalog_profile_details(reply.profile)] if reply.profile else [],
+        user_id=message.user_id
+    )
+
+def response_cache_key(message: ChatMessage, history: List[dict],
+                       snapshot: CatalogSnapshot, now: TimeContext) -> Optional[tuple]:
+    # Only first turns are cached: without history the prompt depends on
+    # nothing but the message, the catalog version and the current minute
+    if history:
+        return None
+    language = detect_language(message.message)
+    return make_key(message.message, language, snapshot.version, now.period)
+
+def cached_response(message: ChatMessage, cache_key: Optional[tuple]) -> Optional[ChatResponse]:
+    if cache_key is None:
+        return None
+    cached = RESPONSE_CACHE.get(cache_key)
+    if cached is None:
+        return None
+    response_text, profiles = cached
+    log.info("response_cache_hit", user_id=message.user_id)
+    save_turn(message.user_id, message.message, response_text)
+    return ChatResponse(response=response_text, profiles=list(profiles), user_id=message.user_id)
+
+def ready_to_serve() -> bool:
+    # The catalog and model are built in the background at startup; a
+    # request must not build either itself on the event loop
+    if PROFILES.loaded and model_ready():
+        return True
+    READINESS.refused += 1
+    return False
+
+def check_ready():
+    if not ready_to_serve():
+        raise HTTPException(status_code=503, detail="Starting up, please retry",
+                            headers={"Retry-After": str(NOT_READY_RETRY_AFTER)})
+
+def check_rate_limit(message: ChatMessage):
+    retry_after = USER_RATE_LIMITER.acquire(message.user_id)
+    if retry_after:
+        log.info("rate_limited", user_id=message.user_id)
+        raise HTTPException(status_code=429, detail="Too many messages, please slow down",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+
+def overloaded_error(e: Overloaded) -> HTTPException:
+    log.warning("request_shed", reason=e.detail, retry_after=e.retry_after)
+    return HTTPException(status_code=503, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+async def generate_reply(prompt: Prompt, request: Optional[Request] = None) -> str:
+    # Only requests that really need the model wait for an admission slot
+    async with ADMISSION.slot():
+        return await generate_text(prompt, request, REPLY_SCHEMA)
+
+def log_user_message(message: ChatMessage):
+    log.info("chat_request", user_id=message.user_id, message=message.message)
+
+def log_model_reply(message: ChatMessage, prompt: Prompt, raw_text: str, response_text: str,
+                    json_data: Optional[dict], profiles: List[ProfileDetails]):
+    fields = dict(user_id=message.user_id, reply_chars=len(raw_text),
+                  has_json=json_data is not None, profiles=len(profiles))
+    # Full bodies are large, so only a sample of requests carries them
+    if log.sample_bodies():
+        fields.update(prompt=str(prompt), raw_response=raw_text, response=response_text,
+                      structured_data=json_data)
+    log.info("model_reply", **fields)
+
+async def answer_chat(message: ChatMessage, request: Optional[Request] = None,
+                      snapshot: Optional[CatalogSnapshot] = None,
+                      profiles_memo: Optional[dict] = None) -> ChatResponse:
+    """One chat turn, from rate limit to saved history. Failures raise HTTPException."""
+    check_rate_limit(message)
+    try:
+        # Turns of one conversation run one at a time, in arrival order, so
+        # each sees the history written by the one before it
+        async with USER_LOCKS.hold(message.user_id):
+            if snapshot is None:
+                snapshot = PROFILES.current
+            with STAGE_SECONDS.time("history_fetch"):
+                history = await SESSION_STORE.fetch(message.user_id)
+            fast_response = fast_path_response(message, history, snapshot)
+            if fast_response is not None:
+                return fast_response
+
+            now = TIME_CONTEXT.now()
+            cache_key = response_cache_key(message, history, snapshot, now)
+            cached = cached_response(message, cache_key)
+            if cached is not None:
+                return cached
+
+            # Get conversation context
+            with STAGE_SECONDS.time("prompt_build"):
+                context = get_conversation_context(message.user_id, history)
+                profiles_data = get_profiles_data(message, history, snapshot, profiles_memo)
+                prompt = build_prompt(message, context, profiles_data, now)
+            PROMPT_TOKENS.observe(prompt.estimated_tokens())
+
+            # Get response from Gemini without blocking the event loop
+            try:
+                with STAGE_SECONDS.time("model_call"):
+                    if cache_key is None:
+                        response_text = await generate_reply(prompt, request)
+                    else:
+                        # Identical first-turn messages that miss the cache together
+                        # share one Gemini call
+                        response_text = await cancel_on_disconnect(
+                            IN_FLIGHT_REPLIES.do(cache_key, lambda: generate_reply(prompt)), request
+                        )
+            except ModelUnavailable as e:
+                # Time-outs end up here as well, once retries or MODEL_DEADLINE run out
+                return degraded_response(message, history, snapshot, e)
+            RESPONSE_TOKENS.observe(estimate_tokens(response_text))
+            raw_text = response_text
+
+            # Extract JSON from response; a reply whose JSON cannot be parsed
+            # keeps its text but is not cached
+            with STAGE_SECONDS.time("json_extraction"):
+                response_text, json_data, error = split_response(response_text)
+                profiles = to_profile_details(json_data)
+            log_model_reply(message, prompt, raw_text, response_text, json_data, profiles)
+            if cache_key is not None and error is None:
+                # The key holds the minute in the prompt; no hit is possible after it
+                RESPONSE_CACHE.set(cache_key, (response_text, profiles), ttl=TIME_CONTEXT.remaining(now))
+
+            with STAGE_SECONDS.time("history_write"):
+                save_turn(message.user_id, message.message, response_text)
             return ChatResponse(
                 response=response_text,
                 profiles=profiles,
                 user_id=message.user_id
             )
-        except Exception as e:
-            print(f"Error parsing JSON: {str(e)}")
-            # If JSON parsing fails, return response without structured data
-            return ChatResponse(
-                response=response_text,
-                profiles=[],
-                user_id=message.user_id
-            )
 
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except ClientDisconnected:
+        # Nobody is listening any more; 499 mirrors nginx's "client closed request"
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    except Exception as e:
+        # The exception text stays in the log; clients get a generic message
+        log.error("chat_failed", user_id=message.user_id, error=repr(e))
+        raise HTTPException(status_code=500, detail="Something went wrong, please try again")
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(message: ChatMessage, request: Request):
+    log_user_message(message)
+    check_ready()
+    return await answer_chat(message, request)
+
+async def answer_batch(messages: List[ChatMessage]) -> List[BatchResult]:
+    results: List[Optional[BatchResult]] = [None] * len(messages)
+    # Each user's turns stay in input order; different users run side by side
+    by_user: Dict[str, List[int]] = {}
+    for index, message in enumerate(messages):
+        by_user.setdefault(message.user_id, []).append(index)
+    # One catalog version and one set of retrieval lookups for the whole batch
+    snapshot = PROFILES.current
+    profiles_memo: dict = {}
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_user(indexes: List[int]):
+        async with slots:
+            for index in indexes:
+                message = messages[index]
+                log_user_message(message)
+                try:
+                    response = await answer_chat(message, None, snapshot, profiles_memo)
+                    results[index] = BatchResult(status=200, response=response)
+                except HTTPException as e:
+                    retry_after = (e.headers or {}).get("Retry-After")
+                    results[index] = BatchResult(
+                        status=e.status_code, detail=e.detail,
+                        retry_after=int(retry_after) if retry_after else None
+                    )
+
+    await asyncio.gather(*(run_user(indexes) for indexes in by_user.values()))
+    return results
+
+@app.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(batch: ChatBatch, request: Request):
+    if len(batch.messages) > BATCH_MAX_MESSAGES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_MESSAGES} messages per batch")
+    check_ready()
+    # Watch for a disconnect once for the whole batch, not once per turn
+    try:
+        results = await cancel_on_disconnect(answer_batch(batch.messages), request)
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    return ChatBatchResponse(results=results)
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def chat_events(message: ChatMessage, session: Optional[ChatSession] = None,
+                      shortcuts: bool = True):
+    """One streamed turn as (event, data) pairs: "token"s, then "profiles" or "error"."""
+    # One turn at a time per conversation, as for /chat
+    async with USER_LOCKS.hold(message.user_id):
+        async for event in reply_events(message, session, shortcuts):
+            yield event
+
+async def stream_chat_events(message: ChatMessage, shortcuts: bool = True):
+    async for event, data in chat_events(message, shortcuts=shortcuts):
+        yield sse_event(event, data)
+
+async def stream_response_events(response: ChatResponse):
+    yield sse_event("token", {"text": response.response})
+    yield sse_event("profiles", response.model_dump())
+
+def shortcut_response(message: ChatMessage, history: List[dict], snapshot: CatalogSnapshot,
+                      now: TimeContext) -> Optional[ChatResponse]:
+    """The fast-path or cached reply to this turn, when it needs no model call."""
+    response = fast_path_response(message, history, snapshot)
+    if response is None:
+        response = cached_response(message, response_cache_key(message, history, snapshot, now))
+    return response
+
+async def reply_events(message: ChatMessage, session: Optional[ChatSession] = None,
+                       shortcuts: bool = True):
+    # shortcuts=False when the caller has already tried the fast path and cache
+    snapshot = PROFILES.current
+    with STAGE_SECONDS.time("history_fetch"):
+        history = await SESSION_STORE.fetch(message.user_id)
+    now = TIME_CONTEXT.now()
+    if shortcuts:
+        shortcut = shortcut_response(message, history, snapshot, now)
+        if shortcut is not None:
+            yield "token", {"text": shortcut.response}
+            yield "profiles", shortcut.model_dump()
+            return
+    cache_key = response_cache_key(message, history, snapshot, now)
+
+    with STAGE_SECONDS.time("prompt_build"):
+        context = get_conversation_context(message.user_id, history)
+        if session is None:
+            profiles_data = get_profiles_data(message, history, snapshot)
+        else:
+            profiles_data = session_profiles_data(session, message, history, snapshot)
+        prompt = build_prompt(message, context, profiles_data, now)
+    PROMPT_TOKENS.observe(prompt.estimated_tokens())
+
+    # Text is pushed as it arrives; the JSON block is held back and parsed
+    # in the same pass
+    extractor = ReplyExtractor()
+    response_text = ""
+    try:
+        # The slot is held until the last chunk has been sent on, so a
+        # slow reader counts against capacity too
+        async with ADMISSION.slot():
+            # For a stream this is the time until the last chunk arrived
+            with STAGE_SECONDS.time("model_call"):
+                async for chunk in stream_text(prompt):
+                    response_text += chunk
+                    text = extractor.feed(chunk)
+                    if text:
+                        yield "token", {"text": text}
+    except Overloaded as e:
+        # Headers are already sent, so the retry hint travels in the event
+        yield "error", {"detail": e.detail, "retry_after": e.retry_after}
+        return
+    except ModelUnavailable as e:
+        # Raised before any text was sent, so the reply can still be replaced
+        degraded = degraded_response(message, history, snapshot, e, session)
+        yield "token", {"text": degraded.response}
+        yield "profiles", degraded.model_dump()
+        return
+    except asyncio.TimeoutError:
+        # A chunk stalled after text was already sent on
+        yield "error", {"detail": "Model response timed out"}
+        return
+    except Exception as e:
+        log.error("chat_failed", user_id=message.user_id, error=repr(e))
+        yield "error", {"detail": "Something went wrong, please try again"}
+        return
+    RESPONSE_TOKENS.observe(estimate_tokens(response_text))
+
+    text = extractor.finish()
+    if text:
+        yield "token", {"text": text}
+    with STAGE_SECONDS.time("json_extraction"):
+        record_parse(extractor.data, extractor.error)
+        profiles = to_profile_details(extractor.data)
+    log_model_reply(message, prompt, response_text, extractor.text, extractor.data, profiles)
+    response_text = extractor.text
+    if cache_key is not None and extractor.error is None:
+        RESPONSE_CACHE.set(cache_key, (response_text, profiles), ttl=TIME_CONTEXT.remaining(now))
+
+    with STAGE_SECONDS.time("history_write"):
+        save_turn(message.user_id, message.message, response_text)
+    yield "profiles", ChatResponse(
+        response=response_text,
+        profiles=profiles,
+        user_id=message.user_id
+    ).model_dump()
+
+@app.post("/chat/stream")
+async def chat_stream(message: ChatMessage):
+    log_user_message(message)
+    check_ready()
+    check_rate_limit(message)
+    async with USER_LOCKS.hold(message.user_id):
+        shortcut = shortcut_response(message, await SESSION_STORE.fetch(message.user_id),
+                                     PROFILES.current, TIME_CONTEXT.now())
+    if shortcut is not None:
+        events = stream_response_events(shortcut)
+    else:
+        # A stream cannot change its status once started, so one that will
+        # call the model is shed up front when the admission queue is full
+        try:
+            ADMISSION.check()
+        except Overloaded as e:
+            raise overloaded_error(e)
+        # Starlette cancels the generator, and with it the Gemini stream,
+        # when the client disconnects
+        events = stream_chat_events(message, shortcuts=False)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def websocket_turn_events(session: ChatSession, text: str):
+    message = ChatMessage(message=text, user_id=session.user_id)
+    log_user_message(message)
+    try:
+        check_rate_limit(message)
+    except HTTPException as e:
+        yield "error", {"detail": e.detail, "retry_after": int(e.headers["Retry-After"])}
+        return
+    session.language = conversation_language(text, session.language)
+    async for event in chat_events(message, session):
+        yield event
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, user_id: str):
+    # Each text frame is {"message": "..."}; the reply comes back as
+    # {"event": ..., "data": ...} frames, the same events /chat/stream sends
+    if not ready_to_serve():
+        # Accepted first: a socket closed during the handshake can only say 403
+        await websocket.accept()
+        await websocket.close(TRY_AGAIN_LATER, "starting up")
+        return
+    await WS_SESSIONS.serve(websocket, user_id, websocket_turn_events)
+
+def start_background_tasks():
+    # Samples the event loop thread, so it has to start on that thread
+    SLOW_REQUEST_PROFILER.start()
+    app.state.catalog_watcher = None
+    app.state.context_cache = None
+
+async def load_catalog():
+    while True:
+        try:
+            READINESS.done("catalog", await PROFILES.load())
+            break
+        except Exception as e:
+            # No profiles means no useful answers: stay unready and retry,
+            # so fixing profiles.txt is enough to bring the worker up
+            READINESS.failed("catalog", e)
+            log.error("catalog_load_failed", path=PROFILES.path, error=str(e))
+            await asyncio.sleep(STARTUP_RETRY_INTERVAL)
+    # Picks up edits to profiles.txt without a restart
+    app.state.catalog_watcher = asyncio.create_task(PROFILES.watch())
+
+async def load_model():
+    READINESS.done("model", await init_model())
+    # No-op unless GEMINI_CONTEXT_CACHE=1 and the SDK supports cached content
+    app.state.context_cache = asyncio.create_task(keep_context_cache_fresh())
+    try:
+        READINESS.done("warmup", await warm_up_model())
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        # Gemini may be briefly unreachable; requests retry and degrade as usual
+        READINESS.failed("warmup", e)
+        log.warning("model_warmup_failed", error=repr(e))
+
+async def initialise():
+    results = await asyncio.gather(load_catalog(), load_model(), return_exceptions=True)
+    for step, result in zip(("catalog", "model"), results):
+        if isinstance(result, Exception):
+            READINESS.failed(step, result)
+            log.error("startup_failed", step=step, error=str(result))
+    log.info("startup", **READINESS.stats())
+
+def shutdown():
+    app.state.startup.cancel()
+    for task in (app.state.context_cache, app.state.catalog_watcher):
+        if task is not None:
+            task.cancel()
+    SLOW_REQUEST_PROFILER.stop()
+    SESSION_STORE.close()
+    log.close()
+
+@app.get("/healthz")
+async def healthz():
+    # The process is up and answering; nothing else is checked
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    # 503 until the catalog is loaded, the model is built and warmed up, so a load
+    # balancer only sends traffic to workers that can serve it
+    return JSONResponse(READINESS.stats(), status_code=200 if READINESS.ready else 503)
+
+@app.get("/stats")
+async def stats():
+    return {
+        "catalog": PROFILES.stats(),
+        "fast_path": PROFILES.current.router.stats() if PROFILES.loaded else None,
+        "response_cache": RESPONSE_CACHE.stats(),
+        "coalescing": IN_FLIGHT_REPLIES.stats(),
+        "sessions": SESSION_STORE.stats(),
+        "context": CONTEXT_BUILDER.stats(),
+        "reply_parsing": REPLY_PARSE_STATS.stats(),
+        "model_calls": MODEL_CALLS.stats(),
+        "startup": READINESS.stats(),
+        "websocket": WS_SESSIONS.stats(),
+        "admission": dict(ADMISSION.stats(), rate_limit=USER_RATE_LIMITER.stats(),
+                          conversations_in_progress=len(USER_LOCKS)),
+        "logging": log.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 if __name__ == "__main__":
     import uvicorn
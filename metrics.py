@@ -0,0 +1,199 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Seconds; spans the fast path (sub-millisecond) up to a slow Gemini call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# FastAPI appends the charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic count, optionally split by label values."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram.
+
+    observe() is a bisect and two additions; cumulative bucket counts are
+    only worked out when /metrics is scraped.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Value read from a callback at scrape time.
+
+    Used for gauges such as a store's size, and for counters that another
+    object already keeps (e.g. ResponseCache.hits). The callback returns a
+    number, or an iterable of (label values, number).
+    """
+
+    def __init__(self, name, documentation, callback: Callable, labelnames=(), kind: str = "gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        value = self.callback()
+        samples: Iterable = [((), value)] if isinstance(value, (int, float)) else value
+        for labels, sample in samples:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(sample)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback, labelnames=()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, callback, labelnames))
+
+    def counter_from(self, name, documentation, callback, labelnames=()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, callback, labelnames, "counter"))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "chat_request_duration_seconds", "Time to serve an HTTP request.", ("path", "status"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "chat_stage_duration_seconds", "Time spent in each stage of a chat request.", ("stage",))
+PROMPT_TOKENS = REGISTRY.histogram(
+    "chat_prompt_tokens", "Estimated tokens per prompt sent to the model.", buckets=TOKEN_BUCKETS)
+RESPONSE_TOKENS = REGISTRY.histogram(
+    "chat_response_tokens", "Estimated tokens per model reply.", buckets=TOKEN_BUCKETS)
+MODEL_ERRORS = REGISTRY.counter(
+    "gemini_errors_total", "Failed model calls by kind.", ("kind",))
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request into REQUEST_SECONDS.
+
+    Paths outside `paths` are reported as "other" to keep label cardinality
+    bounded. `on_finish(scope, duration, start, end)` is called after each request.
+    """
+
+    def __init__(self, app, paths: Sequence[str] = (), on_finish: Callable = None):
+        self.app = app
+        self.paths = set(paths)
+        self.on_finish = on_finish
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            end = time.perf_counter()
+            path = scope["path"] if scope["path"] in self.paths else "other"
+            REQUEST_SECONDS.observe(end - start, path, status[0])
+            if self.on_finish is not None:
+                self.on_finish(scope, end - start, start, end)
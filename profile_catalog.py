@@ -0,0 +1,275 @@
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from geo import DEFAULT_LOCATION, GAZETTEER, distance_km
+from structured_log import log
+
+# Places the catalog knows about, used to fill in missing locations
+KNOWN_PLACES = tuple(GAZETTEER)
+
+ENTRY_RE = re.compile(r"^(\d+)\.\s+(.+)$")
+FIELD_RE = re.compile(r"^\s*(?:-\s*)?([A-Za-z][A-Za-z ]*?):\s*(.*)$")
+BULLET_RE = re.compile(r"^\s*\*\s*(.+)$")
+TITLE_PAREN_RE = re.compile(r"^(.+?)\s*\(([^)]*[A-Za-z][^)]*)\)$")
+COUNT_SUFFIX_RE = re.compile(r"\s*\(\d+ Profiles\)\s*$")
+WORD_RE = re.compile(r"[a-z0-9]+")
+# The leading number of "4.5", "4.5/5" or "4.5 stars"
+RATING_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)")
+
+NAME_FIELDS = ("Name", "Officer")
+DESIGNATION_FIELDS = ("Designation", "Position")
+SPECIALIZATION_FIELDS = ("Specialization", "Speciality", "Service", "Support", "Benefit")
+CONTACT_FIELDS = ("Contact Number", "Contact")
+PERSON_PREFIXES = ("Dr.", "Mr.", "Mrs.", "Ms.")
+
+
+@dataclass
+class Profile:
+    id: int
+    name: str
+    designation: str
+    category: str
+    specialization: Optional[str] = None
+    location: Optional[str] = None
+    rating: Optional[float] = None
+    contact: Optional[str] = None
+    availability: Optional[str] = None
+    details: Dict[str, str] = field(default_factory=dict)
+    # Kilometres from DEFAULT_LOCATION, filled in by ProfileCatalog
+    distance_km: Optional[float] = None
+
+    def to_prompt_line(self) -> str:
+        parts = [self.name, self.designation]
+        if self.specialization:
+            parts.append(f"Specialization: {self.specialization}")
+        if self.location:
+            parts.append(f"Location: {self.location}")
+        if self.distance_km is not None:
+            parts.append(f"Distance from {DEFAULT_LOCATION}: {self.distance_km:.0f} km")
+        if self.rating is not None:
+            parts.append(f"Rating: {self.rating}")
+        parts.append(f"Contact: {self.contact or 'not available'}")
+        if self.availability:
+            parts.append(f"Availability: {self.availability}")
+        parts.extend(f"{key}: {value}" for key, value in self.details.items())
+        return "- " + " | ".join(parts)
+
+
+def _clean_contact(value: str) -> Optional[str]:
+    # Entries like `""  # Direct appointments not allowed` carry no number
+    value = value.split("#", 1)[0].strip().strip('"').strip()
+    return value or None
+
+
+def _parse_rating(value: Optional[str], title: str) -> Optional[float]:
+    if not value:
+        return None
+    match = RATING_RE.match(value)
+    if match is None:
+        # One odd entry should not take the whole file down with it
+        log.warning("profile_rating_unparsed", profile=title, rating=value)
+        return None
+    return float(match.group(1))
+
+
+def _find_place(*texts: Optional[str]) -> Optional[str]:
+    for text in texts:
+        if not text:
+            continue
+        for place in KNOWN_PLACES:
+            if re.search(rf"\b{place}\b", text, re.IGNORECASE):
+                return place
+    return None
+
+
+def _is_section_header(line: str) -> bool:
+    if line[:1].isspace() or ENTRY_RE.match(line):
+        return False
+    first = line[0]
+    if not first.isalnum():
+        # An emoji-led heading like "🏥 Health & Emergency". A stray `"`, `(`,
+        # `*` or `-` line inside an entry is not one
+        return not first.isascii() and unicodedata.category(first).startswith("S")
+    # A plain "Heading:" line
+    return line.endswith(":") and line.count(":") == 1
+
+
+def _clean_category(header: str) -> str:
+    header = header.rstrip(":")
+    header = COUNT_SUFFIX_RE.sub("", header)
+    return header.lstrip("".join(ch for ch in header if not ch.isalnum())).strip()
+
+
+def _build_profile(profile_id: int, category: str, title: str,
+                   fields: Dict[str, str], bullets: Dict[str, List[str]]) -> Profile:
+    fields = dict(fields)
+    for key, items in bullets.items():
+        fields[key] = ", ".join(items)
+
+    def take(keys: Iterable[str]) -> Optional[str]:
+        for key in keys:
+            if fields.get(key):
+                return fields.pop(key)
+        return None
+
+    name = take(NAME_FIELDS)
+    designation = take(DESIGNATION_FIELDS)
+    specialization = take(SPECIALIZATION_FIELDS)
+    paren = TITLE_PAREN_RE.match(title)
+
+    if name:
+        # "Electrician" / "Name: Manoj Chaure"
+        designation = designation or title
+    elif designation:
+        # "Devendra Fadnavis" / "Designation: Chief Minister of Maharashtra"
+        name = title
+    elif paren:
+        # "Dr. Anjali Deshmukh (General Physician)"
+        name, designation = paren.group(1), paren.group(2)
+        specialization = specialization or designation
+    elif " - " in title and title.split(" - ", 1)[1].startswith(PERSON_PREFIXES):
+        # "Mental Health Counsellor - Dr. Alka Sawant"
+        designation, name = title.split(" - ", 1)
+    else:
+        name, designation = title, category
+
+    contact = _clean_contact(take(CONTACT_FIELDS) or "")
+    location = take(("Location",)) or _find_place(fields.get("Address"), title, designation)
+    rating = _parse_rating(take(("Rating",)), title)
+    availability = take(("Availability", "Timing"))
+    return Profile(
+        id=profile_id,
+        name=name.strip(),
+        designation=designation.strip(),
+        category=category,
+        specialization=specialization,
+        location=location,
+        rating=rating,
+        contact=contact,
+        availability=availability,
+        details=fields,
+    )
+
+
+def parse_profiles(text: str) -> List[Profile]:
+    """Parse profiles.txt into one Profile per numbered entry."""
+    profiles: List[Profile] = []
+    category = ""
+    title = None
+    fields: Dict[str, str] = {}
+    bullets: Dict[str, List[str]] = {}
+    list_key = None
+
+    def flush():
+        if title is not None:
+            profiles.append(_build_profile(len(profiles), category, title, fields, bullets))
+
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line.strip():
+            continue
+        if _is_section_header(line):
+            flush()
+            category, title, fields, bullets, list_key = _clean_category(line), None, {}, {}, None
+            continue
+        entry = ENTRY_RE.match(line)
+        if entry:
+            flush()
+            title, fields, bullets, list_key = entry.group(2).strip(), {}, {}, None
+            continue
+        if title is None:
+            continue
+        bullet = BULLET_RE.match(line)
+        if bullet and list_key:
+            bullets.setdefault(list_key, []).append(bullet.group(1).strip())
+            continue
+        pair = FIELD_RE.match(line)
+        if pair:
+            key, value = pair.group(1).strip(), pair.group(2).strip()
+            if value:
+                fields[key] = value
+                list_key = None
+            else:
+                # "Products:" followed by "* item" lines
+                list_key = key
+    flush()
+    return profiles
+
+
+class ProfileCatalog:
+    """In-memory, indexed view over the parsed profiles."""
+
+    def __init__(self, profiles: List[Profile], version: str = ""):
+        self.profiles = profiles
+        self.version = version
+        self._by_category: Dict[str, List[Profile]] = {}
+        self._by_designation_word: Dict[str, List[Profile]] = {}
+        self._by_place: Dict[str, List[Profile]] = {}
+        self._full_text: Optional[str] = None
+        for profile in profiles:
+            # The distance table is looked up once here, not per request
+            profile.distance_km = distance_km(_find_place(profile.location))
+            self._by_category.setdefault(profile.category.lower(), []).append(profile)
+            for word in set(WORD_RE.findall(profile.designation.lower())):
+                self._by_designation_word.setdefault(word, []).append(profile)
+            place = _find_place(profile.location)
+            if place:
+                self._by_place.setdefault(place.lower(), []).append(profile)
+
+    @classmethod
+    def from_text(cls, text: str, profiles: Optional[List[Profile]] = None) -> "ProfileCatalog":
+        """Catalog of `text`; pass `profiles` when it has already been parsed."""
+        version = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        return cls(parse_profiles(text) if profiles is None else profiles, version)
+
+    def __len__(self) -> int:
+        return len(self.profiles)
+
+    def __iter__(self):
+        return iter(self.profiles)
+
+    @property
+    def categories(self) -> List[str]:
+        return list(dict.fromkeys(profile.category for profile in self.profiles))
+
+    def by_category(self, category: str) -> List[Profile]:
+        return list(self._by_category.get(category.lower(), []))
+
+    def by_designation(self, keyword: str) -> List[Profile]:
+        """Profiles whose designation contains every word of `keyword`."""
+        words = WORD_RE.findall(keyword.lower())
+        if not words:
+            return []
+        matches = set(id(profile) for profile in self._by_designation_word.get(words[0], []))
+        for word in words[1:]:
+            matches &= set(id(profile) for profile in self._by_designation_word.get(word, []))
+        return [profile for profile in self._by_designation_word.get(words[0], [])
+                if id(profile) in matches]
+
+    def by_location(self, place: str) -> List[Profile]:
+        return list(self._by_place.get(place.lower(), []))
+
+    def render(self, profiles: Optional[Iterable[Profile]] = None) -> str:
+        """Compact prompt text for `profiles` (default: the whole catalog)."""
+        if profiles is None:
+            if self._full_text is None:
+                self._full_text = self._render(self.profiles)
+            return self._full_text
+        return self._render(profiles)
+
+    @staticmethod
+    def _render(profiles: Iterable[Profile]) -> str:
+        lines = []
+        category = None
+        for profile in profiles:
+            if profile.category != category:
+                category = profile.category
+                if lines:
+                    lines.append("")
+                lines.append(f"{category}:")
+            lines.append(profile.to_prompt_line())
+        return "\n".join(lines)
+
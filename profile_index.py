@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from dataclasses import asdict, replace
+from typing import FrozenSet, List, Optional
+
+import numpy as np
+
+from profile_catalog import Profile, ProfileCatalog, parse_profiles
+from retrieval import ProfileRetriever
+from structured_log import log
+
+# Directory written by ingest.py; loaded at startup when it exists
+PROFILE_INDEX_PATH = os.getenv("PROFILE_INDEX_PATH", "profile_index")
+INDEX_FORMAT = 2
+
+TITLE_RE = re.compile(r"^(?:dr|mr|mrs|ms|shri|smt)\.?\s+", re.IGNORECASE)
+MERGED_FIELDS = ("specialization", "location", "rating", "contact", "availability")
+
+
+def _identity(profile: Profile) -> str:
+    # "Dr. Anjali Deshmukh" and "Anjali  Deshmukh" are the same person
+    name = TITLE_RE.sub("", profile.name.strip())
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+def merge_profiles(primary: List[Profile], extra: List[Profile],
+                   dropped: FrozenSet[str] = frozenset()) -> List[Profile]:
+    """profiles.txt entries first, then document entries for anyone new.
+
+    A document entry for someone already in `primary` only fills in the
+    fields profiles.txt leaves empty, such as an email or an address.
+    Entries for identities in `dropped`, people profiles.txt has since
+    removed or renamed, are left out. Ids are renumbered to the merged
+    order.
+    """
+    merged = [replace(profile, details=dict(profile.details)) for profile in primary]
+    by_identity = {_identity(profile): profile for profile in merged}
+    for profile in extra:
+        if _identity(profile) in dropped:
+            continue
+        match = by_identity.get(_identity(profile))
+        if match is None:
+            match = replace(profile, details=dict(profile.details))
+            merged.append(match)
+            by_identity[_identity(match)] = match
+            continue
+        for attribute in MERGED_FIELDS:
+            if getattr(match, attribute) is None:
+                setattr(match, attribute, getattr(profile, attribute))
+        for key, value in profile.details.items():
+            match.details.setdefault(key, value)
+    for number, profile in enumerate(merged):
+        profile.id = number
+    return merged
+
+
+def _sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def merged_catalog(text: str, extra: List[Profile], dropped: FrozenSet[str] = frozenset(),
+                   primary: Optional[List[Profile]] = None) -> ProfileCatalog:
+    """profiles.txt text merged with ingested entries, versioned by both.
+
+    `primary` is `text` already parsed, when the caller has it.
+    """
+    if primary is None:
+        primary = parse_profiles(text)
+    extra = [profile for profile in extra if _identity(profile) not in dropped]
+    if not extra:
+        return ProfileCatalog.from_text(text, primary)
+    extra_json = json.dumps([asdict(profile) for profile in extra], sort_keys=True, ensure_ascii=False)
+    version = _sha1(text + "\0" + extra_json)[:12]
+    return ProfileCatalog(merge_profiles(primary, extra), version)
+
+
+class ProfileIndex:
+    """A prebuilt catalog and retrieval index, as written by ingest.py.
+
+    The directory holds index.json (merged profiles, the entries taken
+    from documents and the n-gram vocabulary) and two .npy arrays, the
+    IDF weights and the profile matrix, which are memory-mapped rather
+    than read. Loading takes milliseconds, and nothing is parsed or
+    re-indexed as long as profiles.txt still has the content the index
+    was built from. index.json also lists who profiles.txt held then, so
+    an edit that removes or renames someone drops their document entry
+    as well.
+    """
+
+    def __init__(self, path: str, data: dict, idf: np.ndarray, matrix: np.ndarray):
+        self.path = path
+        self.data = data
+        self.idf = idf
+        self.matrix = matrix
+        self.extra_profiles = [Profile(**profile) for profile in data["extra_profiles"]]
+        self.primary_identities = frozenset(data["primary_identities"])
+
+    @property
+    def version(self) -> str:
+        return self.data["version"]
+
+    def matches(self, text: str) -> bool:
+        """Whether the index was built from exactly this profiles.txt text."""
+        return self.data["profiles_sha1"] == _sha1(text)
+
+    def catalog(self) -> ProfileCatalog:
+        return ProfileCatalog([Profile(**profile) for profile in self.data["profiles"]], self.version)
+
+    def retriever(self, catalog: ProfileCatalog) -> ProfileRetriever:
+        return ProfileRetriever.from_arrays(catalog, self.data["vocabulary"], self.idf, self.matrix)
+
+    def merge(self, text: str, primary: Optional[List[Profile]] = None) -> ProfileCatalog:
+        """A catalog for edited profiles.txt text, keeping the ingested entries
+        of everyone it still has and of people only the documents know."""
+        if primary is None:
+            primary = parse_profiles(text)
+        dropped = self.primary_identities - {_identity(profile) for profile in primary}
+        return merged_catalog(text, self.extra_profiles, dropped, primary)
+
+    @classmethod
+    def load(cls, path: str = PROFILE_INDEX_PATH) -> Optional["ProfileIndex"]:
+        """The index at `path`, or None when there is none or it cannot be read."""
+        index_file = os.path.join(path, "index.json")
+        if not os.path.exists(index_file):
+            return None
+        try:
+            with open(index_file, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("format") != INDEX_FORMAT:
+                raise ValueError(f"unsupported index format {data.get('format')}")
+            idf = np.load(os.path.join(path, "idf.npy"), mmap_mode="r")
+            matrix = np.load(os.path.join(path, "matrix.npy"), mmap_mode="r")
+        except Exception as e:
+            log.error("profile_index_load_failed", path=path, error=str(e))
+            return None
+        return cls(path, data, idf, matrix)
+
+
+def write_index(path: str, text: str, extra: List[Profile], sources: dict) -> ProfileCatalog:
+    """Merge, index and write everything the server needs at startup.
+
+    The files are written to a sibling directory first and swapped in
+    whole, so a running server never sees half an index.
+    """
+    primary = parse_profiles(text)
+    catalog = merged_catalog(text, extra, primary=primary)
+    retriever = ProfileRetriever(catalog)
+    vocabulary = sorted(retriever.vocabulary, key=retriever.vocabulary.get)
+    data = {
+        "format": INDEX_FORMAT,
+        "version": catalog.version,
+        "profiles_sha1": _sha1(text),
+        "sources": sources,
+        "profiles": [asdict(profile) for profile in catalog],
+        "extra_profiles": [asdict(profile) for profile in extra],
+        "primary_identities": sorted({_identity(profile) for profile in primary}),
+        "vocabulary": vocabulary,
+    }
+
+    staging = f"{path}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    with open(os.path.join(staging, "index.json"), "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False)
+    np.save(os.path.join(staging, "idf.npy"), retriever.idf.astype(np.float32))
+    np.save(os.path.join(staging, "matrix.npy"), retriever.matrix.astype(np.float32))
+
+    previous = f"{path}.old"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, previous)
+    os.replace(staging, path)
+    shutil.rmtree(previous, ignore_errors=True)
+    return catalog
@@ -0,0 +1,58 @@
+import time
+from typing import Dict, Iterable, Optional
+
+
+class Readiness:
+    """Startup steps a worker has to finish before it should get traffic.
+
+    Each step is pending, done (with the seconds it took), skipped or
+    failed (with the error). The worker is ready once every required step
+    is done and every optional one, like the model warm-up, has at least
+    been tried; an optional step that failed does not hold it back.
+    """
+
+    def __init__(self, required: Iterable[str], optional: Iterable[str] = ()):
+        self.required = tuple(required)
+        self.steps: Dict[str, dict] = {step: {"status": "pending"}
+                                       for step in (*self.required, *optional)}
+        self.started = time.monotonic()
+        self.ready_after: Optional[float] = None
+        # Requests turned away because they arrived before startup was done
+        self.refused = 0
+
+    def done(self, step: str, seconds: Optional[float]):
+        if seconds is None:
+            self.steps[step] = {"status": "skipped"}
+        else:
+            self.steps[step] = {"status": "done", "seconds": round(seconds, 4)}
+        self._check_ready()
+
+    def failed(self, step: str, error: Exception):
+        # A timeout has no message of its own
+        self.steps[step] = {"status": "failed", "error": str(error) or type(error).__name__}
+        self._check_ready()
+
+    def _check_ready(self):
+        if self.ready_after is None and self.ready:
+            self.ready_after = time.monotonic() - self.started
+
+    @property
+    def ready(self) -> bool:
+        return all(state["status"] == "done" if step in self.required else state["status"] != "pending"
+                   for step, state in self.steps.items())
+
+    @property
+    def status(self) -> str:
+        if self.ready:
+            return "ready"
+        if any(self.steps[step]["status"] == "failed" for step in self.required):
+            return "failed"
+        return "starting"
+
+    def stats(self) -> dict:
+        return {
+            "status": self.status,
+            "ready_after_seconds": None if self.ready_after is None else round(self.ready_after, 4),
+            "refused_requests": self.refused,
+            "steps": self.steps,
+        }
@@ -0,0 +1,221 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, Tuple, Type
+
+# Seconds one request may spend on the model in total, retries included
+MODEL_DEADLINE = float(os.getenv("MODEL_DEADLINE", "45"))
+# Extra attempts after a retryable error (timeouts, 429s, 5xx)
+MODEL_RETRIES = int(os.getenv("MODEL_RETRIES", "2"))
+# Backoff before retry n is random between 0 and min(max, base * 2**n)
+MODEL_RETRY_BASE_DELAY = float(os.getenv("MODEL_RETRY_BASE_DELAY", "0.25"))
+MODEL_RETRY_MAX_DELAY = float(os.getenv("MODEL_RETRY_MAX_DELAY", "4"))
+# Send a second, identical call when the first is slower than the recent p95
+MODEL_HEDGE = os.getenv("MODEL_HEDGE", "0") == "1"
+# Successful calls needed before the p95 is trusted for hedging
+HEDGE_MIN_SAMPLES = 20
+# Consecutive failed calls that open the circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# Seconds the circuit stays open before one trial call is let through
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+
+class ModelUnavailable(Exception):
+    """The model could not answer: the circuit is open or retries ran out."""
+
+
+class LatencyWindow:
+    """The last `size` latencies of successful calls."""
+
+    def __init__(self, size: int = 500):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Closed, open and half-open states over consecutive failures.
+
+    After `threshold` failures in a row the circuit opens and calls are
+    refused for `reset_after` seconds. Then a single trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_after: float = CIRCUIT_RESET_SECONDS, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self._trial_running = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if self.clock() - self.opened_at < self.reset_after:
+                return False
+            self.state = self.HALF_OPEN
+        if self._trial_running:
+            return False
+        self._trial_running = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+        self._trial_running = False
+
+    def abandon(self):
+        # The call was cancelled, or failed in a way that says nothing about
+        # the endpoint, e.g. a 400 for a bad prompt; the state stays as it is
+        self._trial_running = False
+
+
+def backoff_delay(attempt: int, base: float = MODEL_RETRY_BASE_DELAY,
+                  cap: float = MODEL_RETRY_MAX_DELAY) -> float:
+    # Full jitter keeps retries from many requests from arriving together
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class ResilientCaller:
+    """Deadline, jittered retries, optional hedging and a circuit breaker.
+
+    call() runs `attempt()` until it succeeds, fails with an error that is
+    not in `retryable`, or runs out of retries or time. Retryable failures
+    count towards the breaker; once it is open call() raises
+    ModelUnavailable at once. With hedging on, a second attempt starts when
+    the first has run longer than the recent p95, and whichever finishes
+    first wins.
+    """
+
+    def __init__(self, retryable: Tuple[Type[BaseException], ...] = (asyncio.TimeoutError,),
+                 deadline: float = MODEL_DEADLINE, retries: int = MODEL_RETRIES,
+                 hedge: bool = MODEL_HEDGE, breaker: Optional[CircuitBreaker] = None):
+        self.retryable = retryable
+        self.deadline = deadline
+        self.retries = retries
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = LatencyWindow()
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.refused = 0
+        self.exhausted = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return self.latencies.quantile(0.95)
+
+    async def call(self, attempt: Callable[[], Awaitable], hedge: bool = True):
+        if not self.breaker.allow():
+            self.refused += 1
+            raise ModelUnavailable("circuit open")
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        last_error: Optional[BaseException] = None
+        try:
+            for number in range(self.retries + 1):
+                if number:
+                    self.retried += 1
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    result = await asyncio.wait_for(self._attempt(attempt, hedge), remaining)
+                except self.retryable as e:
+                    last_error = e
+                    self.breaker.record_failure()
+                    if self.breaker.state == CircuitBreaker.OPEN:
+                        break
+                    pause = min(backoff_delay(number), deadline - loop.time())
+                    if pause > 0:
+                        await asyncio.sleep(pause)
+                    continue
+                except Exception:
+                    # A bad request says nothing about the endpoint's health,
+                    # so it neither closes nor trips the circuit
+                    self.breaker.abandon()
+                    raise
+                self.breaker.record_success()
+                return result
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        self.exhausted += 1
+        raise ModelUnavailable(str(last_error) or type(last_error).__name__) from last_error
+
+    async def _attempt(self, attempt: Callable[[], Awaitable], hedge: bool):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        delay = self.hedge_delay() if hedge else None
+        if delay is None:
+            result = await attempt()
+            self.latencies.add(loop.time() - start)
+            return result
+
+        first = asyncio.ensure_future(attempt())
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                self.hedged += 1
+                pending.add(asyncio.ensure_future(attempt()))
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        self.latencies.add(loop.time() - start)
+                        return task.result()
+                    error = error or task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+            "calls": self.calls,
+            "retries": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "refused": self.refused,
+            "exhausted": self.exhausted,
+            "p95_seconds": self.latencies.quantile(0.95),
+        }
@@ -0,0 +1,100 @@
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+# Maximum number of cached replies
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+# Seconds a cached reply stays valid
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+# Keep Devanagari vowel signs, which \w does not cover, but drop the danda
+PUNCTUATION_RE = re.compile(r"[^\w\s\u0900-\u0963\u0966-\u097F]")
+SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Fold case, punctuation and spacing so near-identical messages share a key."""
+    message = unicodedata.normalize("NFC", message).casefold()
+    message = PUNCTUATION_RE.sub(" ", message)
+    return SPACE_RE.sub(" ", message).strip()
+
+
+def make_key(message: str, language: str, catalog_version: str,
+             time_period: int = 0) -> Tuple[str, str, str, int]:
+    # time_period changes whenever the date and time in the prompt do
+    return (normalize_message(message), language, catalog_version, time_period)
+
+
+class ResponseCache:
+    """Size-bounded LRU cache whose entries also expire after a TTL.
+
+    set() can shorten the TTL of one entry, e.g. to the end of the time
+    period in its key. Expired entries at the old end of the LRU are
+    dropped on every set(), so they never push out live ones.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE,
+                 ttl_seconds: float = RESPONSE_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl is None else min(ttl, self.ttl_seconds)
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+        now = self.clock()
+        self._entries[key] = (now + ttl, value)
+        self._entries.move_to_end(key)
+        self._purge(now)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _purge(self, now: float):
+        while self._entries:
+            expires_at, _ = next(iter(self._entries.values()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+            self.expirations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,255 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from profile_catalog import Profile, ProfileCatalog
+
+# How many candidate profiles go into the prompt
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+# Candidates scoring below this cosine similarity are dropped
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.08"))
+# Weights of the combined ranking: text relevance, rating and closeness to Selu
+RANK_RELEVANCE_WEIGHT = float(os.getenv("RANK_RELEVANCE_WEIGHT", "0.7"))
+RANK_RATING_WEIGHT = float(os.getenv("RANK_RATING_WEIGHT", "0.1"))
+RANK_DISTANCE_WEIGHT = float(os.getenv("RANK_DISTANCE_WEIGHT", "0.2"))
+# Closeness halves with every this many kilometres
+RANK_DISTANCE_HALF_KM = 25.0
+# Rating and closeness assumed for profiles that have none
+RANK_UNKNOWN_SCORE = 0.5
+# The most relevant top_k * RERANK_POOL profiles are re-ranked
+RERANK_POOL = 3
+
+NGRAM_SIZES = (3, 4)
+# \w alone splits Devanagari words at their vowel signs
+WORD_RE = re.compile(r"[\w\u0900-\u097F]+")
+
+# Local words (romanized Marathi, Devanagari, Hindi) mapped to the English
+# vocabulary used in profiles.txt
+QUERY_SYNONYMS: Dict[str, str] = {
+    "mla": "MLA constituency",
+    "amdar": "MLA constituency",
+    "आमदार": "MLA constituency",
+    "cm": "chief minister",
+    "dcm": "deputy chief minister",
+    "mukhyamantri": "chief minister",
+    "मुख्यमंत्री": "chief minister",
+    "mantri": "cabinet minister",
+    "मंत्री": "cabinet minister",
+    "talathi": "talathi land",
+    "तलाठी": "talathi land",
+    "tahsildar": "tahsildar",
+    "tehsildar": "tahsildar",
+    "तहसीलदार": "tahsildar",
+    "sarpanch": "gram sevak",
+    "सरपंच": "gram sevak",
+    "gramsevak": "gram sevak",
+    "collector": "district collector",
+    "doctor": "doctor physician",
+    "dr": "doctor physician",
+    "डॉक्टर": "doctor physician",
+    "dok": "headache general physician",
+    "doka": "headache general physician",
+    "डोक": "headache general physician",
+    "डोकं": "headache general physician",
+    "pot": "stomach general physician",
+    "पोट": "stomach general physician",
+    "tap": "fever general physician",
+    "ताप": "fever general physician",
+    "dukhat": "pain general physician",
+    "दुखतं": "pain general physician",
+    "alergy": "allergy general physician",
+    "mulga": "pediatrician",
+    "bal": "pediatrician",
+    "ambulance": "emergency ambulance",
+    "accident": "emergency ambulance hospital",
+    "suicide": "mental health counsellor",
+    "sucide": "mental health counsellor",
+    "maraych": "mental health counsellor",
+    "maraychi": "mental health counsellor",
+    "आत्महत्या": "mental health counsellor",
+    "tension": "mental health counsellor",
+    "karz": "loan finance NABARD",
+    "कर्ज": "loan finance NABARD",
+    "loan": "loan finance NABARD",
+    "vij": "electrician",
+    "veej": "electrician",
+    "वीज": "electrician",
+    "light": "electrician",
+    "lite": "electrician",
+    "pankha": "electrician",
+    "fan": "electrician",
+    "पंखा": "electrician",
+    "pani": "water plumber municipal",
+    "पाणी": "water plumber municipal",
+    "nal": "plumber",
+    "rasta": "road RTO contractor",
+    "rastyach": "road RTO contractor",
+    "rastyachya": "road RTO contractor",
+    "rastyancha": "road RTO contractor",
+    "रस्ता": "road RTO contractor",
+    "khadde": "road RTO contractor",
+    "खड्डे": "road RTO contractor",
+    "mojani": "land surveyor mojani",
+    "मोजणी": "land surveyor mojani",
+    "jamin": "land talathi surveyor",
+    "जमीन": "land talathi surveyor",
+    "krushi": "agriculture krishi",
+    "krishi": "agriculture krishi",
+    "कृषी": "agriculture krishi",
+    "sheti": "agriculture krishi farm",
+    "शेती": "agriculture krishi farm",
+    "shetkari": "agriculture farmer",
+    "yojana": "scheme yojana",
+    "yojna": "scheme yojana",
+    "योजना": "scheme yojana",
+    "schemes": "scheme yojana",
+    "naukri": "job position salary",
+    "नोकरी": "job position salary",
+    "kaam": "job position",
+    "kapde": "clothing wear shop",
+    "कपडे": "clothing wear shop",
+    "kapda": "clothing wear shop",
+    "plumber": "plumber",
+    "painter": "painter",
+    "sutar": "carpenter",
+}
+
+
+def _ngrams(text: str) -> List[str]:
+    grams = []
+    for word in WORD_RE.findall(text.lower()):
+        padded = f" {word} "
+        for size in NGRAM_SIZES:
+            if len(padded) < size:
+                continue
+            grams.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return grams
+
+
+def expand_query(text: str) -> str:
+    words = WORD_RE.findall(text.lower())
+    extra = [QUERY_SYNONYMS[word] for word in words if word in QUERY_SYNONYMS]
+    return " ".join([text] + extra)
+
+
+def ranking_prior(catalog: ProfileCatalog) -> np.ndarray:
+    """The query-independent part of each profile's score: rating and closeness."""
+    prior = np.empty(len(catalog), dtype=np.float32)
+    for row, profile in enumerate(catalog):
+        rating = profile.rating / 5 if profile.rating is not None else RANK_UNKNOWN_SCORE
+        closeness = (0.5 ** (profile.distance_km / RANK_DISTANCE_HALF_KM)
+                     if profile.distance_km is not None else RANK_UNKNOWN_SCORE)
+        prior[row] = RANK_RATING_WEIGHT * rating + RANK_DISTANCE_WEIGHT * closeness
+    return prior
+
+
+def _profile_document(profile: Profile) -> str:
+    # Designation carries the intent, so it is repeated to weigh more
+    parts = [profile.designation, profile.designation, profile.name, profile.category]
+    if profile.specialization:
+        parts.append(profile.specialization)
+    parts.extend(profile.details.values())
+    return " ".join(parts)
+
+
+class ProfileRetriever:
+    """Character n-gram TF-IDF search over a ProfileCatalog.
+
+    Everything is computed with NumPy at construction time, so a lookup is
+    a single matrix-vector product and needs no network. The most relevant
+    profiles are then re-ranked by relevance, rating and distance from
+    Selu; the last two are precomputed per profile.
+    """
+
+    def __init__(self, catalog: ProfileCatalog):
+        self.catalog = catalog
+        documents = [_ngrams(_profile_document(profile)) for profile in catalog]
+        self.vocabulary: Dict[str, int] = {}
+        for grams in documents:
+            for gram in grams:
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+
+        counts = np.zeros((len(documents), len(self.vocabulary)), dtype=np.float32)
+        for row, grams in enumerate(documents):
+            for gram in grams:
+                counts[row, self.vocabulary[gram]] += 1
+
+        document_frequency = (counts > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(documents)) / (1 + document_frequency)) + 1).astype(np.float32)
+        weights = np.log1p(counts) * self.idf
+        norms = np.linalg.norm(weights, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.matrix = weights / norms
+        self.prior = ranking_prior(catalog)
+
+    @classmethod
+    def from_arrays(cls, catalog: ProfileCatalog, vocabulary: List[str],
+                    idf: np.ndarray, matrix: np.ndarray) -> "ProfileRetriever":
+        """A retriever over arrays saved by a prebuilt index, without re-indexing."""
+        retriever = cls.__new__(cls)
+        retriever.catalog = catalog
+        retriever.vocabulary = {gram: column for column, gram in enumerate(vocabulary)}
+        retriever.idf = idf
+        retriever.matrix = matrix
+        retriever.prior = ranking_prior(catalog)
+        return retriever
+
+    def _query_vector(self, text: str) -> Optional[np.ndarray]:
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for gram in _ngrams(expand_query(text)):
+            column = self.vocabulary.get(gram)
+            if column is not None:
+                vector[column] += 1
+        if not vector.any():
+            return None
+        vector = np.log1p(vector) * self.idf
+        return vector / np.linalg.norm(vector)
+
+    def score(self, text: str) -> np.ndarray:
+        vector = self._query_vector(text)
+        if vector is None or not len(self.catalog):
+            return np.zeros(len(self.catalog), dtype=np.float32)
+        return self.matrix @ vector
+
+    def has_match(self, text: str, min_score: float = RETRIEVAL_MIN_SCORE) -> bool:
+        """Whether any profile is a match for `text` on its own."""
+        return bool((self.score(text) >= min_score).any())
+
+    def search(self, text: str, top_k: int = RETRIEVAL_TOP_K,
+               min_score: float = RETRIEVAL_MIN_SCORE) -> List[Tuple[Profile, float]]:
+        """The top_k matches, best first by combined score, with their relevance."""
+        scores = self.score(text)
+        pool = np.argsort(-scores)[:top_k * RERANK_POOL]
+        pool = pool[scores[pool] >= min_score]
+        if not len(pool):
+            return []
+        relevance = scores[pool] / scores[pool[0]]
+        combined = RANK_RELEVANCE_WEIGHT * relevance + self.prior[pool]
+        order = pool[np.argsort(-combined, kind="stable")][:top_k]
+        return [(self.catalog.profiles[i], float(scores[i])) for i in order]
+
+
+def build_query(message: str, history: List[dict], turns: int = 2) -> str:
+    """The user's message plus their last few messages, for follow-ups like "hoo"."""
+    recent = [turn['user_message'] for turn in history[-turns:]]
+    return " ".join([message, message] + recent)
+
+
+def render_matches(retriever: ProfileRetriever, matches: List[Tuple[Profile, float]]) -> str:
+    """Prompt text for search results, or the full catalog if there are none."""
+    if not matches:
+        return retriever.catalog.render()
+    # Best match first, but a category's profiles stay together so its
+    # heading is rendered once
+    first_rank: Dict[str, int] = {}
+    for rank, (profile, _) in enumerate(matches):
+        first_rank.setdefault(profile.category, rank)
+    profiles = sorted((profile for profile, _ in matches), key=lambda profile: first_rank[profile.category])
+    return retriever.catalog.render(profiles)
+
+
+def select_profiles_text(retriever: ProfileRetriever, message: str, history: List[dict]) -> str:
+    """Prompt text for the best-matching profiles, or the full catalog if nothing matches."""
+    return render_matches(retriever, retriever.search(build_query(message, history)))
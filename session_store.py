@@ -0,0 +1,318 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List
+
+from structured_log import log
+
+# Keep only last 10 messages per user
+MAX_TURNS_PER_SESSION = 10
+
+# "memory" (per worker) or "sqlite" (shared between workers and restarts)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", str(24 * 3600)))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_BATCH_SIZE = int(os.getenv("SESSION_BATCH_SIZE", "32"))
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.5"))
+# Seconds between recounts of the sessions in the sqlite store, for /stats and /metrics
+SESSION_COUNT_INTERVAL = 30.0
+
+# Rough per-turn overhead of the dict and its keys, on top of the text
+TURN_OVERHEAD_BYTES = 400
+
+
+def turn_size(turn: dict) -> int:
+    return TURN_OVERHEAD_BYTES + sum(
+        len(value.encode("utf-8")) for value in turn.values() if isinstance(value, str)
+    )
+
+
+class SessionStore(ABC):
+    """Conversation history per user_id, oldest turn first.
+
+    A turn is a dict with timestamp, user_message and assistant_response.
+    Every backend keeps at most MAX_TURNS_PER_SESSION turns per user.
+    """
+
+    @abstractmethod
+    def get(self, user_id: str) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def append(self, user_id: str, turn: dict):
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    async def fetch(self, user_id: str) -> List[dict]:
+        """get() for the event loop; stores that do I/O run it in a thread."""
+        return self.get(user_id)
+
+    def flush(self):
+        """Write out anything buffered. No-op for stores that do not buffer."""
+
+    def close(self):
+        self.flush()
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__, "sessions": len(self)}
+
+
+class _Session:
+    __slots__ = ("turns", "last_seen", "size")
+
+    def __init__(self):
+        self.turns: List[dict] = []
+        self.last_seen = 0.0
+        self.size = 0
+
+
+class MemorySessionStore(SessionStore):
+    """Per-worker store bounded by session count, idle time and total bytes.
+
+    Sessions are kept in LRU order. The least recently used sessions are
+    dropped first when a bound is exceeded.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS,
+                 idle_ttl: float = SESSION_IDLE_TTL,
+                 max_bytes: int = SESSION_MAX_BYTES, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, user_id: str) -> List[dict]:
+        session = self._sessions.get(user_id)
+        if session is None:
+            return []
+        if self.clock() - session.last_seen > self.idle_ttl:
+            self._drop(user_id)
+            return []
+        return list(session.turns)
+
+    def append(self, user_id: str, turn: dict):
+        now = self.clock()
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = self._sessions[user_id] = _Session()
+        self._sessions.move_to_end(user_id)
+        session.last_seen = now
+
+        session.turns.append(turn)
+        size = turn_size(turn)
+        session.size += size
+        self.total_bytes += size
+        while len(session.turns) > MAX_TURNS_PER_SESSION:
+            dropped = turn_size(session.turns.pop(0))
+            session.size -= dropped
+            self.total_bytes -= dropped
+        self._evict(now)
+
+    def _drop(self, user_id: str):
+        session = self._sessions.pop(user_id)
+        self.total_bytes -= session.size
+        self.evictions += 1
+
+    def _evict(self, now: float):
+        # Oldest sessions sit at the front of the OrderedDict
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if (len(self._sessions) > self.max_sessions
+                    or self.total_bytes > self.max_bytes
+                    or now - session.last_seen > self.idle_ttl):
+                self._drop(user_id)
+            else:
+                break
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(bytes=self.total_bytes, evictions=self.evictions)
+        return stats
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite-backed store shared by every worker on the host.
+
+    The database runs in WAL mode so readers never wait for the writer.
+    append() only queues the turn; one writer thread per worker writes
+    queued turns in one transaction once SESSION_BATCH_SIZE are waiting
+    or SESSION_FLUSH_INTERVAL has passed. A write that fails, e.g. on
+    "database is locked", is logged and retried with the next batch.
+    Reads see this worker's queued turns too, and fetch() runs them in a
+    worker thread so a busy database never stalls the event loop. The
+    session count is recounted by the writer every SESSION_COUNT_INTERVAL
+    seconds, so it is approximate.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH, batch_size: int = SESSION_BATCH_SIZE,
+                 flush_interval: float = SESSION_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Guards _pending; only ever held for list operations
+        self._changed = threading.Condition()
+        self._pending: List[tuple] = []
+        self._closing = False
+        self._flush_requested = False
+        self._sessions = 0
+        self.write_failures = 0
+        self._read_lock = threading.Lock()
+        self._db = self._connect()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id TEXT NOT NULL,"
+            " timestamp TEXT NOT NULL,"
+            " user_message TEXT NOT NULL,"
+            " assistant_response TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS turns_user ON turns (user_id, id)")
+        self._writer = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    def __len__(self) -> int:
+        with self._changed:
+            return self._sessions
+
+    def get(self, user_id: str) -> List[dict]:
+        # Pending turns are read first: a turn the writer commits in between
+        # then shows up in both, and is dropped from the pending side below
+        with self._changed:
+            pending = [entry[1:] for entry in self._pending if entry[0] == user_id]
+        with self._read_lock:
+            rows = self._db.execute(
+                "SELECT timestamp, user_message, assistant_response FROM turns"
+                " WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, MAX_TURNS_PER_SESSION),
+            ).fetchall()
+        written = set(rows)
+        rows = list(reversed(rows)) + [entry for entry in pending if entry not in written]
+        return [
+            {"timestamp": timestamp, "user_message": user_message, "assistant_response": assistant_response}
+            for timestamp, user_message, assistant_response in rows[-MAX_TURNS_PER_SESSION:]
+        ]
+
+    async def fetch(self, user_id: str) -> List[dict]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, user_id)
+
+    def append(self, user_id: str, turn: dict):
+        with self._changed:
+            self._pending.append(
+                (user_id, turn["timestamp"], turn["user_message"], turn["assistant_response"])
+            )
+            if len(self._pending) >= self.batch_size:
+                self._changed.notify_all()
+
+    def _run(self):
+        db = self._connect()
+        counted = float("-inf")
+        while True:
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: (self._closing or self._flush_requested
+                             or len(self._pending) >= self.batch_size),
+                    timeout=self.flush_interval,
+                )
+                batch = list(self._pending)
+                closing = self._closing
+                self._flush_requested = False
+            if batch and self._write(db, batch):
+                with self._changed:
+                    # append() only adds at the end, so the batch is still the head
+                    del self._pending[:len(batch)]
+                    self._changed.notify_all()
+            elif batch and not closing:
+                # Give a locked database time to clear before the next attempt
+                with self._changed:
+                    self._changed.wait_for(lambda: self._closing, timeout=self.flush_interval)
+            if time.monotonic() - counted >= SESSION_COUNT_INTERVAL:
+                counted = time.monotonic()
+                self._count(db)
+            if closing:
+                db.close()
+                return
+
+    def _write(self, db: sqlite3.Connection, batch: List[tuple]) -> bool:
+        users = {(entry[0],) for entry in batch}
+        try:
+            db.execute("BEGIN")
+            db.executemany(
+                "INSERT INTO turns (user_id, timestamp, user_message, assistant_response)"
+                " VALUES (?, ?, ?, ?)",
+                batch,
+            )
+            # Trim every touched session back to its last turns
+            db.executemany(
+                "DELETE FROM turns WHERE user_id = ?1 AND id NOT IN"
+                " (SELECT id FROM turns WHERE user_id = ?1 ORDER BY id DESC LIMIT "
+                f"{MAX_TURNS_PER_SESSION})",
+                users,
+            )
+            db.execute("COMMIT")
+            return True
+        except sqlite3.Error as e:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            self.write_failures += 1
+            log.error("session_write_failed", turns=len(batch), error=str(e))
+            return False
+
+    def _count(self, db: sqlite3.Connection):
+        try:
+            sessions = db.execute("SELECT COUNT(DISTINCT user_id) FROM turns").fetchone()[0]
+        except sqlite3.Error as e:
+            log.warning("session_count_failed", error=str(e))
+            return
+        with self._changed:
+            self._sessions = sessions
+
+    def flush(self, timeout: float = 5.0):
+        """Wait up to `timeout` seconds for the writer to write every queued turn."""
+        with self._changed:
+            self._flush_requested = True
+            self._changed.notify_all()
+            self._changed.wait_for(lambda: not self._pending or not self._writer.is_alive(), timeout)
+
+    def close(self):
+        with self._changed:
+            self._closing = True
+            self._changed.notify_all()
+        self._writer.join(5.0)
+        with self._read_lock:
+            self._db.close()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._changed:
+            stats.update(pending_writes=len(self._pending), write_failures=self.write_failures)
+        return stats
+
+
+def create_session_store() -> SessionStore:
+    if SESSION_STORE == "sqlite":
+        return SQLiteSessionStore()
+    if SESSION_STORE != "memory":
+        raise ValueError(f"Unknown SESSION_STORE: {SESSION_STORE}")
+    return MemorySessionStore()
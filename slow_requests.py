@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from structured_log import log
+
+# Requests slower than this many seconds get a profile report; 0 turns the profiler off
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0"))
+# Seconds between stack samples of the event loop thread
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+# Samples kept in memory; older ones are dropped
+PROFILER_BUFFER = 20000
+# Stacks shown per report
+PROFILER_TOP_STACKS = 10
+
+
+def _stack(frame, depth: int = 12) -> str:
+    names = []
+    while frame is not None and len(names) < depth:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return " <- ".join(names)
+
+
+class SlowRequestProfiler:
+    """Sampling profiler that only reports on slow requests.
+
+    A daemon thread records the event loop thread's stack every
+    PROFILER_INTERVAL seconds into a ring buffer. When a request takes
+    longer than the threshold, the samples taken during it are grouped
+    and the most frequent stacks are logged. Samples of an idle loop
+    (waiting in select) show that the time went to awaiting I/O, such as
+    the model call, rather than to code blocking the loop.
+    """
+
+    def __init__(self, threshold: float = SLOW_REQUEST_SECONDS, interval: float = PROFILER_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self._samples = deque(maxlen=PROFILER_BUFFER)
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.reports = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._samples.append((time.perf_counter(), _stack(frame)))
+
+    def request_finished(self, scope, duration: float, start: float, end: float):
+        if not self.enabled or duration < self.threshold:
+            return
+        stacks = Counter(stack for at, stack in list(self._samples) if start <= at <= end)
+        total = sum(stacks.values())
+        self.reports += 1
+        log.warning(
+            "slow_request",
+            method=scope.get("method"),
+            path=scope.get("path"),
+            seconds=round(duration, 3),
+            samples=total,
+            top_stacks=[
+                {"share": round(count / total, 3), "stack": stack}
+                for stack, count in stacks.most_common(PROFILER_TOP_STACKS)
+            ],
+        )
@@ -0,0 +1,175 @@
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+# Records below this level are dropped before they are queued
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# JSON-lines file to write to; empty means stdout
+LOG_FILE = os.getenv("LOG_FILE", "")
+# The file is rotated once it grows past this many bytes
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+# Rotated files kept next to LOG_FILE (LOG_FILE.1 is the newest)
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Fraction of requests whose full prompt and reply are logged
+LOG_BODY_SAMPLE_RATE = float(os.getenv("LOG_BODY_SAMPLE_RATE", "0.05"))
+# Records waiting to be written; when full, new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_STOP = object()
+
+
+class _Sink:
+    """Appends lines to a file, rotating it by size, or to stdout."""
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file = None
+        self._size = 0
+        if path:
+            self._open()
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+        # Never rotate something like /dev/null
+        self._rotates = os.path.isfile(self.path)
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def write(self, lines: str):
+        if self._file is None:
+            sys.stdout.write(lines)
+            sys.stdout.flush()
+            return
+        size = len(lines.encode("utf-8"))
+        if self._rotates and self.max_bytes > 0 and self._size and self._size + size > self.max_bytes:
+            self._rotate()
+        self._file.write(lines)
+        self._file.flush()
+        self._size += size
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StructuredLogger:
+    """Non-blocking JSON-lines logger.
+
+    log() only checks the level and puts a tuple on a bounded queue; a
+    background thread serializes records and writes them in batches. When
+    the queue is full the record is dropped and counted rather than
+    blocking the event loop. After close(), the next record starts a new
+    writer thread, so the app can be started again in the same process.
+    """
+
+    def __init__(self, level: str = LOG_LEVEL, path: str = LOG_FILE,
+                 max_bytes: int = LOG_MAX_BYTES, backup_count: int = LOG_BACKUP_COUNT,
+                 body_sample_rate: float = LOG_BODY_SAMPLE_RATE, queue_size: int = LOG_QUEUE_SIZE):
+        self.level = LEVELS.get(level.upper(), LEVELS["INFO"])
+        self.body_sample_rate = body_sample_rate
+        self._sink_args = (path, max_bytes, backup_count)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._start()
+        if level.upper() not in LEVELS:
+            self.warning("log_level_unknown", log_level=level, using="INFO")
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._sink = _Sink(*self._sink_args)
+            self._thread = threading.Thread(target=self._run, name="structured-log", daemon=True)
+            self._thread.start()
+
+    def sample_bodies(self) -> bool:
+        """Whether this request's full prompt and reply should be logged."""
+        return self.body_sample_rate > 0 and random.random() < self.body_sample_rate
+
+    def log(self, level: str, event: str, **fields):
+        if LEVELS[level] < self.level:
+            return
+        try:
+            self._queue.put_nowait((time.time(), level, event, fields))
+        except queue.Full:
+            self.dropped += 1
+        if not self._thread.is_alive():
+            self._start()
+
+    def debug(self, event: str, **fields):
+        self.log("DEBUG", event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log("INFO", event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log("WARNING", event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log("ERROR", event, **fields)
+
+    @staticmethod
+    def _format(record) -> str:
+        created, level, event, fields = record
+        entry = {"ts": datetime.fromtimestamp(created).isoformat(timespec="milliseconds"),
+                 "level": level, "event": event}
+        entry.update(fields)
+        return json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Write whatever else is already waiting in one go
+            while len(batch) < 256:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(record is _STOP for record in batch)
+            lines = "".join(self._format(record) for record in batch if record is not _STOP)
+            if lines:
+                try:
+                    self._sink.write(lines)
+                    self.written += len(batch) - stop
+                except Exception as e:
+                    sys.stderr.write(f"structured log write failed: {e}\n")
+            if stop:
+                self._sink.close()
+                return
+
+    def close(self, timeout: float = 5.0):
+        """Write out everything queued so far and stop the writer thread."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+
+log = StructuredLogger()
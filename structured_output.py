@@ -0,0 +1,222 @@
+import json
+import typing
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+GEMINI_TYPES = {str: "STRING", int: "INTEGER", float: "NUMBER", bool: "BOOLEAN"}
+
+
+def gemini_schema(annotation, exclude=()) -> dict:
+    """Translate a pydantic model (or field annotation) into a Gemini response schema.
+
+    Gemini accepts only a subset of OpenAPI, so Optional[X] becomes a
+    nullable X instead of the anyOf that pydantic's own JSON schema uses.
+    """
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union and type(None) in args:
+        inner = [arg for arg in args if arg is not type(None)]
+        return dict(gemini_schema(inner[0]), nullable=True)
+    if origin in (list, List):
+        return {"type": "ARRAY", "items": gemini_schema(args[0])}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        fields = {name: field for name, field in annotation.model_fields.items() if name not in exclude}
+        return {
+            "type": "OBJECT",
+            "properties": {name: gemini_schema(field.annotation) for name, field in fields.items()},
+            "required": [name for name, field in fields.items() if field.is_required()],
+        }
+    return {"type": GEMINI_TYPES[annotation]}
+
+
+def _is_reply_data(value) -> bool:
+    return isinstance(value, dict) and ("profiles" in value or "response" in value)
+
+
+# Extractor states
+_TEXT, _BACKTICKS, _FENCE_TAG, _OBJECT, _DONE = range(5)
+
+
+class ReplyExtractor:
+    """Splits a model reply into its text and its JSON block in a single pass.
+
+    Feed chunks as they arrive; feed() returns the text that is safe to
+    show so far. A '{' opens a candidate object whose braces are counted
+    outside JSON strings. A closed candidate holding "profiles" or
+    "response" becomes the structured data; any other candidate, such as a
+    stray brace in the text, is released back into the text. Markdown
+    code fences are dropped and anything after the JSON block is ignored.
+    A reply that is only a JSON object with a "response" field, as schema
+    constrained generation returns it, takes its text from that field.
+    """
+
+    def __init__(self):
+        self.data: Optional[dict] = None
+        self.error: Optional[str] = None
+        self._text: List[str] = []
+        self._state = _TEXT
+        self._backticks = 0
+        self._object: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> str:
+        emitted: List[str] = []
+        for char in chunk:
+            state = self._state
+            if state == _DONE:
+                break
+            if state == _OBJECT:
+                self._feed_object(char, emitted)
+                continue
+            if state == _FENCE_TAG:
+                if char.isalpha():
+                    continue
+                self._state = _TEXT
+            elif state == _BACKTICKS:
+                if char == "`":
+                    self._backticks += 1
+                    if self._backticks == 3:
+                        self._state = _FENCE_TAG
+                    continue
+                emitted.append("`" * self._backticks)
+                self._state = _TEXT
+
+            if char == "`":
+                self._state = _BACKTICKS
+                self._backticks = 1
+            elif char == "{":
+                self._open_object()
+            else:
+                emitted.append(char)
+        text = "".join(emitted)
+        self._text.append(text)
+        return text
+
+    def _open_object(self):
+        self._state = _OBJECT
+        self._object = ["{"]
+        self._depth = 1
+        self._in_string = False
+        self._escaped = False
+
+    def _release_object(self, emitted: List[str]):
+        # Not JSON after all: the candidate goes back into the text
+        emitted.extend(self._object)
+        self._object = []
+        self._state = _TEXT
+
+    def _feed_object(self, char: str, emitted: List[str]):
+        if self._in_string:
+            if char == "\n":
+                # JSON strings cannot hold a raw newline
+                self._object.append(char)
+                self._release_object(emitted)
+                return
+            self._object.append(char)
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+            return
+
+        if len(self._object) == 1 and not char.isspace() and char not in '"}':
+            # An object can only start with a key, so this brace belongs to the text
+            self._release_object(emitted)
+            emitted.append(char)
+            return
+
+        self._object.append(char)
+        if char == '"':
+            self._in_string = True
+        elif char == "{":
+            self._depth += 1
+        elif char == "}":
+            self._depth -= 1
+            if self._depth == 0:
+                self._close_object(emitted)
+
+    def _close_object(self, emitted: List[str]):
+        raw = "".join(self._object)
+        try:
+            value = json.loads(raw)
+        except ValueError as e:
+            if '"profiles"' in raw or '"response"' in raw:
+                self.error = f"invalid JSON: {e}"
+                self._object = []
+                self._state = _DONE
+            else:
+                self._release_object(emitted)
+            return
+        if _is_reply_data(value):
+            self.data = value
+            self._object = []
+            self._state = _DONE
+        else:
+            self._release_object(emitted)
+
+    def finish(self) -> str:
+        """Flush anything still held back; returns the last text to show."""
+        emitted: List[str] = []
+        if self._state == _BACKTICKS:
+            emitted.append("`" * self._backticks)
+        elif self._state == _OBJECT:
+            raw = "".join(self._object)
+            if '"profiles"' in raw or '"response"' in raw:
+                self.error = "JSON block was cut off"
+            else:
+                emitted.extend(self._object)
+        self._object = []
+        self._state = _DONE
+        text = "".join(emitted)
+        self._text.append(text)
+        return text
+
+    @property
+    def text(self) -> str:
+        text = "".join(self._text).strip()
+        if not text and self.data is not None and isinstance(self.data.get("response"), str):
+            return self.data["response"].strip()
+        return text
+
+
+def split_reply(response_text: str) -> Tuple[str, Optional[dict], Optional[str]]:
+    """Return (text, data, error) for a complete reply."""
+    extractor = ReplyExtractor()
+    extractor.feed(response_text)
+    extractor.finish()
+    return extractor.text, extractor.data, extractor.error
+
+
+class ParseStats:
+    """Counts how model replies parsed, for /stats."""
+
+    def __init__(self):
+        self.replies = 0
+        self.structured = 0
+        self.without_json = 0
+        self.failures = 0
+        self.invalid_profiles = 0
+
+    def record(self, data: Optional[dict], error: Optional[str]):
+        self.replies += 1
+        if error is not None:
+            self.failures += 1
+        elif data is None:
+            self.without_json += 1
+        else:
+            self.structured += 1
+
+    def stats(self) -> dict:
+        return {
+            "replies": self.replies,
+            "structured": self.structured,
+            "without_json": self.without_json,
+            "failures": self.failures,
+            "failure_rate": round(self.failures / self.replies, 4) if self.replies else 0.0,
+            "invalid_profiles": self.invalid_profiles,
+        }
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import os
+import re
+
+# Seconds the stub waits before answering, to mimic a model round trip
+STUB_MODEL_LATENCY = float(os.getenv("STUB_MODEL_LATENCY", "0"))
+# Characters per streamed chunk
+STUB_CHUNK_SIZE = 24
+
+PROFILE_LINE_RE = re.compile(r"^- (?P<name>[^|]+?) \| (?P<designation>[^|]+?)(?: \| (?P<rest>.*))?$", re.M)
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubTokenCount:
+    def __init__(self, total_tokens: int):
+        self.total_tokens = total_tokens
+
+
+class StubStream:
+    def __init__(self, text: str, latency: float):
+        self.text = text
+        self.latency = latency
+
+    async def __aiter__(self):
+        chunks = [self.text[i:i + STUB_CHUNK_SIZE] for i in range(0, len(self.text), STUB_CHUNK_SIZE)]
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / max(len(chunks), 1))
+            yield StubResponse(chunk)
+
+
+def _first_profile(prompt: str):
+    section = prompt.rsplit("Available Profiles and Services:", 1)[-1]
+    match = PROFILE_LINE_RE.search(section)
+    if match is None:
+        return None
+    fields = dict(
+        part.split(": ", 1) for part in (match.group("rest") or "").split(" | ") if ": " in part
+    )
+    return {
+        "name": match.group("name"),
+        "designation": match.group("designation"),
+        "contact_number": fields.get("Contact", ""),
+        "specialization": fields.get("Specialization", match.group("designation")),
+        "rating": float(fields["Rating"]) if "Rating" in fields else 4.0,
+        "location": fields.get("Location", "Selu"),
+        "appointment": False,
+        "task": False,
+    }
+
+
+def stub_reply(prompt: str, structured: bool = False) -> str:
+    """A deterministic reply in the shape Gemini is asked for.
+
+    With `structured` the reply is a single JSON object, as schema
+    constrained generation returns it.
+    """
+    profile = _first_profile(prompt)
+    if profile is None:
+        text, profiles = "How can I help you today?", []
+    else:
+        text = f"{profile['name']} ({profile['designation']}) can help you with this. Would you like their details?"
+        profiles = [profile]
+    if structured:
+        return json.dumps({"response": text, "profiles": profiles}, ensure_ascii=False)
+    if not profiles:
+        return text
+    return f"{text}\n\n{json.dumps({'profiles': profiles}, ensure_ascii=False, indent=2)}"
+
+
+class StubModel:
+    """Offline stand-in for genai.GenerativeModel.
+
+    Answers from the prompt alone with a fixed template, so the whole
+    pipeline can run without network access or an API key.
+    """
+
+    def __init__(self, latency: float = STUB_MODEL_LATENCY):
+        self.latency = latency
+        self.calls = 0
+
+    async def generate_content_async(self, contents, stream: bool = False,
+                                     generation_config=None, **kwargs):
+        self.calls += 1
+        structured = "response_schema" in (generation_config or {})
+        text = self.reply(str(contents), structured)
+        if stream:
+            return StubStream(text, self.latency)
+        await asyncio.sleep(self.latency)
+        return StubResponse(text)
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        structured = "response_schema" in (kwargs.get("generation_config") or {})
+        return StubResponse(self.reply(str(contents), structured))
+
+    def count_tokens(self, contents):
+        from token_count import estimate_tokens
+        return StubTokenCount(estimate_tokens(str(contents)))
+
+    def reply(self, prompt: str, structured: bool = False) -> str:
+        return stub_reply(prompt, structured)
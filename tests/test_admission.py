@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Overloaded, UserLocks, UserRateLimiter
+
+
+def test_slots_are_handed_out_in_arrival_order():
+    async def scenario():
+        admission = AdmissionController(max_active=1, queue_depth=5, queue_timeout=1)
+        order = []
+
+        async def request(name):
+            async with admission.slot():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(request(name) for name in "abcd"))
+        return admission, order
+
+    admission, order = asyncio.run(scenario())
+    assert order == list("abcd")
+    assert (admission.active, admission.admitted, admission.stats()["queued"]) == (0, 4, 0)
+
+
+def test_a_full_queue_is_refused_at_once():
+    async def scenario():
+        admission = AdmissionController(max_active=1, queue_depth=1, queue_timeout=1)
+        await admission.acquire()
+        queued = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as refused:
+            admission.check()
+        with pytest.raises(Overloaded):
+            await admission.acquire()
+        admission.release()
+        await queued
+        return admission, refused.value
+
+    admission, refused = asyncio.run(scenario())
+    assert refused.retry_after >= 1
+    assert admission.rejected == 2
+    assert admission.active == 1
+
+
+def test_a_queued_request_times_out():
+    async def scenario():
+        admission = AdmissionController(max_active=1, queue_depth=1, queue_timeout=0.01)
+        await admission.acquire()
+        with pytest.raises(Overloaded):
+            await admission.acquire()
+        return admission
+
+    admission = asyncio.run(scenario())
+    assert admission.timed_out == 1
+    assert admission.stats()["queued"] == 0
+
+
+def test_a_cancelled_waiter_is_skipped():
+    async def scenario():
+        admission = AdmissionController(max_active=1, queue_depth=5, queue_timeout=1)
+        await admission.acquire()
+        first = asyncio.ensure_future(admission.acquire())
+        second = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        admission.release()
+        await second
+        return admission, first
+
+    admission, first = asyncio.run(scenario())
+    assert first.cancelled()
+    assert admission.active == 1
+    assert admission.stats()["queued"] == 0
+
+
+def test_rate_limiter_allows_a_burst_then_refills():
+    now = [0.0]
+    limiter = UserRateLimiter(rate=1, burst=2, clock=lambda: now[0])
+    assert limiter.acquire("u") == 0
+    assert limiter.acquire("u") == 0
+    assert limiter.acquire("u") == pytest.approx(1.0)
+    assert limiter.acquire("other") == 0
+    now[0] = 1.0
+    assert limiter.acquire("u") == 0
+    assert limiter.limited == 1
+
+
+def test_rate_limiter_forgets_the_least_recent_users():
+    limiter = UserRateLimiter(rate=1, burst=1, max_users=2, clock=lambda: 0.0)
+    for user_id in ("a", "b", "c"):
+        limiter.acquire(user_id)
+    assert limiter.stats()["users"] == 2
+    # "a" was forgotten, so it starts again with a full bucket
+    assert limiter.acquire("a") == 0
+
+
+def test_user_locks_run_turns_in_order_and_are_dropped_when_idle():
+    async def scenario():
+        locks = UserLocks()
+        order = []
+
+        async def turn(name):
+            async with locks.hold("u"):
+                order.append(f"{name} start")
+                await asyncio.sleep(0.01)
+                order.append(f"{name} end")
+
+        await asyncio.gather(turn("a"), turn("b"))
+        return locks, order
+
+    locks, order = asyncio.run(scenario())
+    assert order == ["a start", "a end", "b start", "b end"]
+    assert len(locks) == 0
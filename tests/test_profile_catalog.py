@@ -0,0 +1,116 @@
+import os
+
+from profile_catalog import ProfileCatalog, parse_profiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OFFICIALS = """🏛️ Top Maharashtra Government Officials (10 Profiles)
+1. Devendra Fadnavis
+Designation: Chief Minister of Maharashtra
+Location: Mumbai
+Contact Number: ""  # Direct appointments not allowed
+Availability: By official channels only
+
+2. Eknath Shinde
+Designation: Deputy Chief Minister of Maharashtra
+Location: Mumbai
+"""
+
+HEALTH = """🏥 Health & Emergency (10 Profiles)
+1. Dr. Anjali Deshmukh (General Physician)
+Contact: 9876543210
+Availability: Mon, Tue, Thu, Sat | 9 AM - 5 PM
+
+2. Apollo Diagnostics, Parbhani
+Service: Blood Test & Pathology
+Contact: 9833441122
+
+3. Mental Health Counsellor - Dr. Alka Sawant
+Contact: 9876500000
+"""
+
+SHOPS = """Clothing Shops in Selu:
+
+1. Vidarbha Textile
+   - Location: Near Bus Stand, Selu
+   - Speciality: Modi Style Clothes
+   - Products:
+     * Traditional Wear
+     * Party Wear
+   - Contact: 9765432101
+   - Timing: 10 AM - 9 PM
+"""
+
+
+def test_real_file_parses_every_section():
+    with open(os.path.join(ROOT, "profiles.txt"), encoding="utf-8") as file:
+        profiles = parse_profiles(file.read())
+    categories = list(dict.fromkeys(profile.category for profile in profiles))
+    assert len(profiles) == 63
+    assert categories == [
+        "Top Maharashtra Government Officials",
+        "Government Services",
+        "Health & Emergency",
+        "Agriculture Services & Schemes",
+        "Utilities & Local Services",
+        "Job Listings in Selu Region",
+        "Clothing Shops in Selu",
+    ]
+    assert [profile.id for profile in profiles] == list(range(63))
+
+
+def test_officials_take_the_title_as_name():
+    first, second = parse_profiles(OFFICIALS)
+    assert first.category == "Top Maharashtra Government Officials"
+    assert first.name == "Devendra Fadnavis"
+    assert first.designation == "Chief Minister of Maharashtra"
+    assert first.location == "Mumbai"
+    assert first.contact is None
+    assert first.availability == "By official channels only"
+    assert second.name == "Eknath Shinde"
+
+
+def test_title_shapes_in_health_section():
+    doctor, lab, counsellor = parse_profiles(HEALTH)
+    assert (doctor.name, doctor.designation) == ("Dr. Anjali Deshmukh", "General Physician")
+    assert doctor.specialization == "General Physician"
+    assert (lab.name, lab.designation, lab.specialization) == (
+        "Apollo Diagnostics, Parbhani", "Health & Emergency", "Blood Test & Pathology")
+    assert lab.location == "Parbhani"
+    assert (counsellor.name, counsellor.designation) == ("Dr. Alka Sawant", "Mental Health Counsellor")
+
+
+def test_indented_fields_and_bullet_lists():
+    (shop,) = parse_profiles(SHOPS)
+    assert shop.category == "Clothing Shops in Selu"
+    assert shop.specialization == "Modi Style Clothes"
+    assert shop.contact == "9765432101"
+    assert shop.availability == "10 AM - 9 PM"
+    assert shop.details["Products"] == "Traditional Wear, Party Wear"
+
+
+def test_stray_punctuation_lines_do_not_start_a_section():
+    text = HEALTH.replace(
+        "Contact: 9876543210\n",
+        'Contact: 9876543210\n"Call before visiting"\n(closed on holidays)\n* walk-ins welcome\n- home visits\n',
+    )
+    profiles = parse_profiles(text)
+    assert len(profiles) == 3
+    assert {profile.category for profile in profiles} == {"Health & Emergency"}
+    assert profiles[0].availability == "Mon, Tue, Thu, Sat | 9 AM - 5 PM"
+
+
+def test_ratings_keep_their_number_and_bad_ones_are_skipped():
+    text = "Doctors:\n1. Dr. A (Dentist)\nRating: 4.5/5\n\n2. Dr. B (Surgeon)\nRating: excellent\n"
+    good, bad = parse_profiles(text)
+    assert good.rating == 4.5
+    assert bad.rating is None
+
+
+def test_catalog_indexes_and_versions_by_content():
+    catalog = ProfileCatalog.from_text(OFFICIALS + "\n" + HEALTH)
+    assert len(catalog) == 5
+    assert [p.name for p in catalog.by_designation("deputy chief minister")] == ["Eknath Shinde"]
+    assert [p.name for p in catalog.by_location("parbhani")] == ["Apollo Diagnostics, Parbhani"]
+    assert catalog.version == ProfileCatalog.from_text(OFFICIALS + "\n" + HEALTH).version
+    assert catalog.version != ProfileCatalog.from_text(OFFICIALS).version
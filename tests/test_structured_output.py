@@ -0,0 +1,77 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from structured_output import ParseStats, ReplyExtractor, gemini_schema, split_reply
+
+JSON_BLOCK = '{"response": "Call Dr. Anjali", "profiles": [{"name": "Dr. Anjali Deshmukh"}]}'
+
+
+def test_text_and_json_block_are_split():
+    text, data, error = split_reply("Please call Dr. Anjali.\n" + JSON_BLOCK)
+    assert text == "Please call Dr. Anjali."
+    assert data["profiles"][0]["name"] == "Dr. Anjali Deshmukh"
+    assert error is None
+
+
+def test_code_fences_and_trailing_text_are_dropped():
+    text, data, _ = split_reply("Here you go.\n```json\n" + JSON_BLOCK + "\n```\nAnything after")
+    assert text == "Here you go."
+    assert data is not None
+
+
+def test_braces_in_the_text_are_kept():
+    text, data, error = split_reply("Use {name} or {\"a\": 1} in the form")
+    assert text == 'Use {name} or {"a": 1} in the form'
+    assert data is None and error is None
+
+
+def test_a_json_only_reply_takes_its_text_from_the_response_field():
+    text, data, _ = split_reply(JSON_BLOCK)
+    assert text == "Call Dr. Anjali"
+    assert data is not None
+
+
+def test_broken_and_cut_off_blocks_are_reported():
+    _, data, error = split_reply('Text {"profiles": [oops]}')
+    assert data is None and error.startswith("invalid JSON")
+    _, data, error = split_reply('Text {"profiles": [{"name": "A"')
+    assert data is None and error == "JSON block was cut off"
+
+
+def test_chunks_split_anywhere_give_the_same_result():
+    reply = 'Call now `please`.\n```json\n' + JSON_BLOCK + '\n```'
+    expected = split_reply(reply)
+    for size in (1, 2, 3, 7):
+        extractor = ReplyExtractor()
+        shown = "".join(extractor.feed(reply[i:i + size]) for i in range(0, len(reply), size))
+        shown += extractor.finish()
+        assert (extractor.text, extractor.data, extractor.error) == expected
+        assert "{" not in shown
+
+
+def test_gemini_schema_marks_optional_fields_nullable():
+    class Item(BaseModel):
+        name: str
+        rating: Optional[float] = None
+
+    class Reply(BaseModel):
+        response: str
+        items: List[Item]
+        user_id: str
+
+    schema = gemini_schema(Reply, exclude=("user_id",))
+    assert schema["required"] == ["response", "items"]
+    assert "user_id" not in schema["properties"]
+    item = schema["properties"]["items"]["items"]
+    assert item["properties"]["rating"] == {"type": "NUMBER", "nullable": True}
+    assert item["required"] == ["name"]
+
+
+def test_parse_stats_count_each_outcome():
+    stats = ParseStats()
+    stats.record({"profiles": []}, None)
+    stats.record(None, None)
+    stats.record(None, "invalid JSON")
+    assert stats.stats() == {"replies": 3, "structured": 1, "without_json": 1, "failures": 1,
+                             "failure_rate": 0.3333, "invalid_profiles": 0}
@@ -0,0 +1,57 @@
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+# IANA zone the assistant tells the time in, e.g. "Asia/Kolkata"; empty means the server's zone
+TIME_ZONE = os.getenv("TIME_ZONE", "")
+# The prompt's date and time, and the reply cache, change at most this often
+TIME_GRANULARITY_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class TimeContext:
+    date: str
+    day: str
+    time: str
+    # Start of the period in epoch seconds; part of response cache keys
+    period: int
+    # End of the period in epoch seconds, when this context stops being current
+    ends: int
+
+
+class TimeContextProvider:
+    """Formatted date, day and time for the prompt.
+
+    The strings are rebuilt only when the clock moves into a new minute;
+    every other call returns the same TimeContext object.
+    """
+
+    def __init__(self, zone: str = TIME_ZONE, granularity: int = TIME_GRANULARITY_SECONDS,
+                 clock=time.time):
+        self.granularity = granularity
+        self.clock = clock
+        self.tz = None
+        if zone:
+            from zoneinfo import ZoneInfo
+            self.tz = ZoneInfo(zone)
+        self._current: Optional[TimeContext] = None
+
+    def now(self) -> TimeContext:
+        period = int(self.clock()) // self.granularity * self.granularity
+        current = self._current
+        if current is None or current.period != period:
+            moment = datetime.fromtimestamp(period, self.tz)
+            current = self._current = TimeContext(
+                date=moment.strftime("%d %B %Y"),
+                day=moment.strftime("%A"),
+                time=moment.strftime("%I:%M %p"),
+                period=period,
+                ends=period + self.granularity,
+            )
+        return current
+
+    def remaining(self, context: TimeContext) -> float:
+        """Seconds until the prompt would show a different time than `context`."""
+        return context.ends - self.clock()
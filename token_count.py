@@ -0,0 +1,12 @@
+def estimate_tokens(text: str) -> int:
+    """Cheap offline estimate of how many Gemini tokens `text` costs.
+
+    Latin text averages about four characters per token; Devanagari is
+    split much finer, so non-ASCII characters are counted more heavily.
+    Use the model's count_tokens when an exact number is needed.
+    """
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    ascii_chars = len(text) - non_ascii
+    return max(1, round(ascii_chars / 4 + non_ascii / 1.5))